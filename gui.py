@@ -1,4 +1,7 @@
+import os
+import re
 import streamlit as st
+from models import metrics, timing
 
 st.set_page_config(page_title="Email Assistant", layout="wide")
 
@@ -6,38 +9,67 @@ st.set_page_config(page_title="Email Assistant", layout="wide")
 # Cache resource loading
 @st.cache_resource
 def load_resources():
-    from models.models import analyze, get_sentence_formality_match
-    from nltk.tokenize import sent_tokenize
-    from models.gpt import gpt_feedback, gpt_generate_and_analyze, gpt_edit_email
+    from functools import partial
+    from models.formality.incremental_formality import FormalityDocument
+    from models.gpt import gpt_feedback, gpt_generate_and_analyze, gpt_edit_email, gpt_feedback_stream, gpt_generate_stream
+    from models.gpt import new_feedback_discourse, new_generation_discourse
+    from models.client import connect
+
+    # one metrics endpoint for the streamlit process, shared by every session
+    if metrics.PORT:
+        metrics.serve(int(metrics.PORT))
+
+    # with a running `sentify.py serve` (SENTIFY_SERVER), the models stay in the server process
+    client = connect()
+    if client is not None:
+        analyze = client.analyze
+        FormalityDocument = partial(FormalityDocument, classify=client.formality_labels)
+    else:
+        if os.environ.get("SENTIFY_BACKEND") == "multitask":
+            from models.multitask.multitask_model import analyze, model_ids
+        else:
+            from models.models import analyze, model_ids
+        from models.cache import cached_analyze
+        from models import registry
+
+        # start loading the models while the first frame renders
+        registry.prewarm()
+        analyze = cached_analyze(analyze, model_ids())
 
     return (
         analyze,
-        get_sentence_formality_match,
+        FormalityDocument,
         gpt_feedback,
         gpt_generate_and_analyze,
         gpt_edit_email,
-        sent_tokenize,
+        gpt_feedback_stream,
+        gpt_generate_stream,
+        new_feedback_discourse,
+        new_generation_discourse,
     )
 
 
 # Load all resources at once
 (
     analyze,
-    get_sentence_formality_match,
+    FormalityDocument,
     gpt_feedback,
     gpt_generate_and_analyze,
     gpt_edit_email,
-    sent_tokenize,
+    gpt_feedback_stream,
+    gpt_generate_stream,
+    new_feedback_discourse,
+    new_generation_discourse,
 ) = load_resources()
 
 
 def chatbot_response(input_text):
     sentiment = analyze(input_text)
-    return gpt_feedback(input_text, sentiment)
+    return gpt_feedback(input_text, sentiment, discourse=st.session_state.feedback_discourse)
 
 
 def generate_email_response(input_text):
-    return gpt_generate_and_analyze(input_text, analyze)
+    return gpt_generate_and_analyze(input_text, analyze, discourse=st.session_state.generation_discourse)
 
 
 def get_edits(input_text, mode="Auto", target=None):
@@ -47,9 +79,65 @@ def get_edits(input_text, mode="Auto", target=None):
     return gpt_edit_email(input_text, sentiment, target)
 
 
-def check_formality(input_text, target_formality):
-    flagged_sentences = get_sentence_formality_match(input_text, target_formality)
-    return flagged_sentences
+def show_analysis_summary(sentiment_data):
+    # classifier results, shown while the feedback is still streaming
+    st.caption(
+        f"Sentiment: {sentiment_data['sentiment_category']} · Intent: {sentiment_data['intent']} · "
+        f"Formality: {sentiment_data['formality']} · Audience: {sentiment_data['audience']}"
+    )
+
+
+def check_formality(input_text, target_formality, section="body"):
+    # one document per section, so re-checking after an edit only classifies changed sentences
+    document = st.session_state.formality_documents.setdefault(section, FormalityDocument())
+    document.update(input_text)
+    document.nomatch(target_formality)
+    # the checked text with its sentence spans and flags, kept for the highlighter
+    return document.document
+
+
+def underline_flagged(text, detected_formality):
+    return f"<u style='color: red'><span style='color: white' title='Detected: {detected_formality.capitalize()}'>{text}</span></u>"
+
+
+def paragraphs_to_html(text):
+    # blank lines become breaks, other whitespace collapses to single spaces
+    return re.sub(r"\s+", " ", re.sub(r"\s*\n\s*\n\s*", "<br><br>", text))
+
+
+def highlight_document(document):
+    # sentences are matched to their flags by span, in one pass over the text
+    html = ""
+    for text, flag in document.segments():
+        text = paragraphs_to_html(text)
+        html += underline_flagged(text, flag["detected_formality"]) if flag else text
+    # drop breaks left by blank lines around the text
+    return re.sub(r"^(\s|<br>)+|(\s|<br>)+$", "", html)
+
+
+def start_timing():
+    # time the stages of one action when the sidebar toggle is on
+    if st.session_state.get("show_timings"):
+        return timing.start()
+    return None
+
+
+def save_timings(action, started):
+    if started is None:
+        return
+    timings, token = started
+    timing.stop(token)
+    st.session_state.latest_timings = {"action": action, "timings": timings.as_dict()}
+
+
+def show_timings_panel():
+    st.sidebar.toggle("Show timings", key="show_timings", help="Time each stage of the next action")
+    latest = st.session_state.get("latest_timings")
+    if st.session_state.show_timings and latest:
+        st.sidebar.markdown(f"**{latest['action']}**")
+        st.sidebar.table(
+            [{"stage": name, "ms": entry["ms"], "calls": entry["calls"]} for name, entry in latest["timings"].items()]
+        )
 
 
 tab_chat, tab_emailassistant, tab_formality = st.tabs(
@@ -82,7 +170,7 @@ def initialize_session_state():
         "feedback_input": False,
         "formality_target": "Neutral",
         "formality_analysis_result": {},
-        "formality_email_text": {},
+        "formality_documents": {},
         "generated_emails": [],
         "messages": [],
     }
@@ -91,6 +179,12 @@ def initialize_session_state():
         if key not in st.session_state:
             st.session_state[key] = default_value
 
+    # each session has its own token-budgeted conversation with the model
+    if "feedback_discourse" not in st.session_state:
+        st.session_state.feedback_discourse = new_feedback_discourse()
+    if "generation_discourse" not in st.session_state:
+        st.session_state.generation_discourse = new_generation_discourse()
+
 
 # Initialize session state variables
 initialize_session_state()
@@ -113,6 +207,8 @@ with tab_chat:
         with col2:
             if st.button("Yes, clear chat", key="confirm_clear"):
                 st.session_state.messages = []
+                st.session_state.feedback_discourse.clear()
+                st.session_state.generation_discourse.clear()
                 st.session_state.latest_email = ""
                 st.session_state.latest_analysis = {}
                 st.session_state.show_clear_dialog = False
@@ -129,7 +225,8 @@ with tab_chat:
     col_chat, col_email = st.columns([2, 3], gap="large")
 
     with col_chat:
-        with st.container(height=400, border=True):
+        chat_box = st.container(height=400, border=True)
+        with chat_box:
             for msg in st.session_state.messages:
                 with st.chat_message(msg["role"]):
                     st.markdown(msg["content"])
@@ -181,41 +278,62 @@ with tab_chat:
             user_input = st.chat_input("Type your email content...")
 
         if user_input:
-            with st.spinner("Thinking..."):
+            started = start_timing()
+            st.session_state.messages.append(
+                {"role": "user", "content": user_input}
+            )
+            with chat_box:
+                with st.chat_message("user"):
+                    st.markdown(user_input)
+            targets=None
+            if mode == "Generate Email":
+                targets = {}
+                if tone_mode == "Guided":
+                    targets = {
+                        "intent": st.session_state.chatbot_target_intent,
+                        "formality": st.session_state.chatbot_target_formality,
+                        "audience": st.session_state.chatbot_target_audience,
+                        "polarity": st.session_state.chatbot_target_polarity,
+                    }
+                # stream the email into the chat as it is written
+                with chat_box:
+                    with st.chat_message("assistant"):
+                        generated_email = st.write_stream(
+                            gpt_generate_stream(
+                                user_input,
+                                targets=targets,
+                                discourse=st.session_state.generation_discourse,
+                                feedback=st.session_state.feedback_input,
+                            )
+                        ).strip()
+                with st.spinner("Analyzing..."):
+                    sentiment_data = analyze(generated_email)
+                show_analysis_summary(sentiment_data)
+                with st.expander("Feedback", expanded=True):
+                    feedback = st.write_stream(gpt_feedback_stream(generated_email, sentiment_data, discourse=st.session_state.feedback_discourse))
+            else: # Feedback Only
+                with st.spinner("Analyzing..."):
+                    generated_email, sentiment_data = gpt_generate_and_analyze(
+                        text=user_input, analyze_function=analyze, targets=targets, discourse=st.session_state.generation_discourse, discourse_append=True, feedback=st.session_state.feedback_input
+                    )
+                show_analysis_summary(sentiment_data)
+                with chat_box:
+                    with st.chat_message("assistant"):
+                        feedback = st.write_stream(gpt_feedback_stream(generated_email, sentiment_data, discourse=st.session_state.feedback_discourse))
+            st.session_state.feedback = feedback
+            st.session_state.latest_email = generated_email
+            st.session_state.latest_analysis = sentiment_data
+            st.session_state.generated_emails.append(generated_email)
+            if mode == "Generate Email":
                 st.session_state.messages.append(
-                    {"role": "user", "content": user_input}
+                    {"role": "assistant", "content": generated_email}
                 )
-                targets=None
-                discourse_append=None
-                if mode == "Generate Email":                    
-                    targets = {}
-                    if tone_mode == "Guided":
-                        targets = {
-                            "intent": st.session_state.chatbot_target_intent,
-                            "formality": st.session_state.chatbot_target_formality,
-                            "audience": st.session_state.chatbot_target_audience,
-                            "polarity": st.session_state.chatbot_target_polarity,
-                        }
-                    discourse_append=False
-                else: # Feedback Only
-                    discourse_append=True
-                generated_email, sentiment_data = gpt_generate_and_analyze(
-                    text=user_input, analyze_function=analyze, targets=targets, discourse_append=discourse_append, feedback=st.session_state.feedback_input
+            else: # Feedback only
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": feedback}
                 )
-                feedback = gpt_feedback(generated_email, sentiment_data)
-                st.session_state.feedback = feedback
-                st.session_state.latest_email = generated_email
-                st.session_state.latest_analysis = sentiment_data
-                st.session_state.generated_emails.append(generated_email)
-                if mode == "Generate Email":
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": generated_email}
-                    )
-                else: # Feedback only
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": feedback}
-                    )
-                st.rerun()
+            save_timings(mode, started)
+            st.rerun()
         if st.button("Clear Chat 🗑️", use_container_width=True):
             st.session_state.show_clear_dialog = True
         if st.session_state.get("show_clear_dialog", False):
@@ -410,6 +528,7 @@ with tab_emailassistant:
                         ]
                     )
                     # Generate suggestions
+                    started = start_timing()
                     with st.spinner("Generating suggestions..."):
                         if current_mode == "Auto":
                             result = get_edits(email_text)
@@ -423,6 +542,7 @@ with tab_emailassistant:
                             result = get_edits(email_text, mode="Guided", target=target)
 
                         st.session_state.sentiment = result
+                        save_timings("Generate suggestions", started)
                         st.rerun()
         # Suggestions panel
         with col_suggestions:
@@ -592,27 +712,21 @@ with tab_formality:
         )
         if st.button("Check Formality", type="primary"):
             if email_input or salutation or closing:
+                started = start_timing()
                 with st.spinner("Analyzing formality..."):
                     # Analyze each section separately
-                    flagged_body = check_formality(
-                        email_input, st.session_state.formality_target.lower()
-                    )
-                    flagged_salutation = check_formality(
-                        salutation, st.session_state.formality_target.lower()
-                    )
-                    flagged_closing = check_formality(
-                        closing, st.session_state.formality_target.lower()
-                    )
                     st.session_state.formality_analysis_result = {
-                        "salutation": flagged_salutation,
-                        "body": flagged_body,
-                        "closing": flagged_closing,
-                    }
-                    st.session_state.formality_email_text = {
-                        "salutation": salutation,
-                        "body": email_input,
-                        "closing": closing,
+                        "salutation": check_formality(
+                            salutation, st.session_state.formality_target.lower(), "salutation"
+                        ),
+                        "body": check_formality(
+                            email_input, st.session_state.formality_target.lower()
+                        ),
+                        "closing": check_formality(
+                            closing, st.session_state.formality_target.lower(), "closing"
+                        ),
                     }
+                save_timings("Check Formality", started)
             else:
                 st.error(
                     "Please enter at least one field to check formality.", icon="🚨"
@@ -620,61 +734,35 @@ with tab_formality:
 
     with col2:
         st.subheader("Formality Issues Underlined")
-        if (
-            "formality_analysis_result" in st.session_state
-            and "formality_email_text" in st.session_state
-        ):
-            original_text = st.session_state.formality_email_text
-            flagged_info = st.session_state.formality_analysis_result
+        if st.session_state.formality_analysis_result:
+            documents = st.session_state.formality_analysis_result
 
             highlighted_text = ""
 
             # ---- Handle Salutation ----
-            salutation_text = original_text.get("salutation", "").strip()
-            flagged_salutation = flagged_info.get("salutation", [])
+            salutation_document = documents["salutation"]
+            salutation_text = salutation_document.text.strip()
 
             if salutation_text:
-                if flagged_salutation:
-                    detected_formality = flagged_salutation[0]["detected_formality"]
-                    highlighted_text += f"<u style='color: red'><span style='color:white' title='Detected: {detected_formality.capitalize()}'>{salutation_text}</span></u><br><br>"
+                if salutation_document.flags:
+                    detected_formality = next(iter(salutation_document.flags.values()))["detected_formality"]
+                    highlighted_text += f"{underline_flagged(salutation_text, detected_formality)}<br><br>"
                 else:
                     highlighted_text += f"{salutation_text}<br><br>"
 
             # ---- Handle Body ----
-            body_text = original_text.get("body", "").strip()
-            flagged_body = flagged_info.get("body", [])
-
-            paragraphs = body_text.split("\n\n")
-
-            for paragraph in paragraphs:
-                paragraph = paragraph.strip()
-                if not paragraph:
-                    continue
+            body_html = highlight_document(documents["body"])
+            if body_html:
+                highlighted_text += f"{body_html}<br><br>"
 
-                sentences = sent_tokenize(paragraph)
-
-                for sent in sentences:
-                    flagged = False
-                    detected_formality = ""
-
-                    for item in flagged_body:
-                        if sent.strip() == item["sentence"].strip():
-                            flagged = True
-                            detected_formality = item["detected_formality"]
-                            break
-
-                    if flagged:
-                        highlighted_text += f"<u style='color: red'><span style='color: white' title='Detected: {detected_formality.capitalize()}'>{sent}</span></u> "
-                    else:
-                        highlighted_text += f"{sent} "
-                highlighted_text += "<br><br>"  # after paragraph
-            closing_text = original_text.get("closing", "").strip()
-            flagged_closing = flagged_info.get("closing", [])
+            # ---- Handle Closing ----
+            closing_document = documents["closing"]
+            closing_text = closing_document.text.strip()
 
             if closing_text:
-                if flagged_closing:
-                    detected_formality = flagged_closing[0]["detected_formality"]
-                    highlighted_text += f"<u style='color: red'><span style='color: white' title='Detected: {detected_formality.capitalize()}'>{closing_text}</span></u>"
+                if closing_document.flags:
+                    detected_formality = next(iter(closing_document.flags.values()))["detected_formality"]
+                    highlighted_text += underline_flagged(closing_text, detected_formality)
                 else:
                     highlighted_text += f"{closing_text}"
 
@@ -685,3 +773,5 @@ with tab_formality:
             st.info(
                 "Paste your email and click 'Check Formality' to see highlighted results."
             )
+
+show_timings_panel()
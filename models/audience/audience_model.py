@@ -1,13 +1,45 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
+from models import batching, inference, onnx_backend, quantization, registry, timing
+from models.batching import MicroBatcher
+from models.inference import classify_batch
+
+MODEL_REPO = "parvk11/audience_classifier_model"
+reverse_label_map = {0: 'professional', 1: 'personal', 2: 'general'}
+
+def load_audience_model():
+    if onnx_backend.enabled():
+        return onnx_backend.load("audience")
+    with registry.import_lock:
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    audience_tokenizer = AutoTokenizer.from_pretrained(MODEL_REPO)
+    audience_model = AutoModelForSequenceClassification.from_pretrained(MODEL_REPO)
+    if quantization.enabled("audience", MODEL_REPO):
+        audience_model = quantization.quantize(audience_model)
+    return audience_tokenizer, audience_model
+
+registry.register("audience", load_audience_model)
 
-audience_tokenizer = AutoTokenizer.from_pretrained("parvk11/audience_classifier_model")
-audience_model = AutoModelForSequenceClassification.from_pretrained("parvk11/audience_classifier_model")
 def get_audience(text):
-    inputs = audience_tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    outputs = audience_model(**inputs)
+    # the batch path also handles texts longer than the model's max length
+    if batching.ENABLED or inference.WINDOWED:
+        return get_audience_batch([text])[0]
+    audience_tokenizer, audience_model = registry.get("audience")
+    with timing.span("tokenize"):
+        encodings, _ = inference.encode(audience_tokenizer, [text], windowed=False)
+        inputs = audience_tokenizer.pad(encodings, return_tensors="pt")
+    with timing.span("forward"):
+        outputs = audience_model(**inputs)
     probs = torch.nn.functional.softmax(outputs.logits, dim=1)
     pred = torch.argmax(probs, dim=1).item()
     confidence = probs[0][pred].item()
-    reverse_label_map = {0: 'professional', 1: 'personal', 2: 'general'}
-    return reverse_label_map[pred], confidence
\ No newline at end of file
+    return reverse_label_map[pred], confidence
+
+def get_audience_batch(texts, batch_size=32):
+    return audience_batcher(texts, batch_size)
+
+def run_audience_batch(texts, batch_size=32):
+    audience_tokenizer, audience_model = registry.get("audience")
+    results = classify_batch(audience_tokenizer, audience_model, texts, batch_size)
+    return [(reverse_label_map[pred], confidence) for pred, confidence in results]
+
+audience_batcher = MicroBatcher(run_audience_batch, "audience")
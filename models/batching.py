@@ -0,0 +1,103 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models import metrics, timing
+
+# coalesce concurrent calls to the transformer models into shared batches (SENTIFY_MICROBATCH=1)
+ENABLED = os.environ.get("SENTIFY_MICROBATCH", "0") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("SENTIFY_MAX_BATCH", "32"))
+MAX_WAIT = float(os.environ.get("SENTIFY_MAX_WAIT_MS", "5")) / 1000
+MAX_QUEUE = int(os.environ.get("SENTIFY_MAX_QUEUE", "256"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+class MicroBatcher:
+    # Runs batch_function(items, batch_size) on a single worker thread. Requests that
+    # arrive while the worker is busy, or within max_wait of each other, are merged
+    # into one call of up to max_batch_size items and each caller gets its own slice
+    # of the results back. Requests beyond max_queue are refused with QueueFull.
+    def __init__(self, batch_function, name="model", max_batch_size=None, max_wait=None, max_queue=None):
+        self.batch_function = batch_function
+        self.name = name
+        self.max_batch_size = max_batch_size or MAX_BATCH_SIZE
+        self.max_wait = MAX_WAIT if max_wait is None else max_wait
+        self.requests = queue.Queue(maxsize=max_queue or MAX_QUEUE)
+        self.worker = None
+        self.worker_lock = threading.Lock()
+        metrics.register_gauge_function("sentify_queue_depth", self.depth, model=name)
+
+    def __call__(self, items, batch_size=32):
+        if not ENABLED:
+            return self.batch_function(items, batch_size)
+        # the wait includes other callers' items batched with these
+        with timing.span("microbatch"):
+            return self.submit(items).result()
+
+    def submit(self, items):
+        items = list(items)
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        self.start()
+        try:
+            self.requests.put_nowait((items, future))
+        except queue.Full:
+            raise QueueFull(f"{self.requests.maxsize} requests already waiting") from None
+        return future
+
+    def depth(self):
+        return self.requests.qsize()
+
+    def start(self):
+        with self.worker_lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, daemon=True, name=f"sentify-batcher-{self.name}")
+                self.worker.start()
+
+    def next_batch(self):
+        # block for the first request, then take whatever else arrives before the deadline
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            items = [item for request_items, _ in batch for item in request_items]
+            metrics.observe("sentify_batch_size", len(items), model=self.name)
+            try:
+                results = self.batch_function(items, self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_items, future in batch:
+                future.set_result(results[start:start + len(request_items)])
+                start += len(request_items)
@@ -0,0 +1,209 @@
+# Replays the bundled datasets through the analyzers and reports cold start, latency
+# percentiles, throughput and peak memory. Save a baseline, then compare later runs:
+#
+#   python -m models.benchmark --out out/benchmark.json
+#   python -m models.benchmark --compare out/benchmark.json --max-regression 0.1
+
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+datasets = {
+    "intent": ("models/intent/intent_classification_dataset.csv", "text"),
+    "synthetic": ("models/intent/large_synthetic_email_sentiment_dataset.csv", "email"),
+    "sentiment": ("models/sentiment/email_sentiment_full_dataset.csv", "email_text"),
+}
+
+single_targets = ["analyze", "sentiment", "intent", "formality", "audience", "sentence_formality"]
+
+
+def load_texts(names, limit=None):
+    texts = []
+    for name in names:
+        path, column = datasets[name]
+        with open(path, newline="", encoding="utf-8") as f:
+            texts.extend(row[column] for row in csv.DictReader(f))
+    return texts[:limit]
+
+
+def peak_rss_mb():
+    # the process-wide high-water mark, so it is reported once for the whole run
+    # (ru_maxrss is in kilobytes on Linux and bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, emails, seconds):
+    latencies = sorted(latencies)
+    return {
+        "calls": len(latencies),
+        "emails": emails,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "emails_per_sec": round(emails / seconds, 2),
+    }
+
+
+def cold_start():
+    # import and load every model, as a fresh sentify.py process would
+    start = time.perf_counter()
+    from models import models, registry
+    registry.prewarm(background=False)
+    loaded = time.perf_counter()
+    models.analyze("Warming up the first call.")
+    return {
+        "load_seconds": round(loaded - start, 3),
+        "first_call_seconds": round(time.perf_counter() - loaded, 3),
+    }
+
+
+def get_target(name):
+    from models import models
+    return {
+        "analyze": lambda text: models.analyze(text, concurrent=False),
+        "sentiment": models.analyze_sentiment,
+        "intent": models.analyze_intent,
+        "formality": models.analyze_formality,
+        "audience": models.analyze_audience,
+        "sentence_formality": models.get_sentence_formality,
+    }[name]
+
+
+def run_single(target, texts, concurrency):
+    def timed(text):
+        start = time.perf_counter()
+        target(text)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [timed(text) for text in texts]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, texts))
+    return summarize(latencies, len(texts), time.perf_counter() - start)
+
+
+def run_batched(texts, batch_size):
+    from models.models import analyze_batch
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        batch_start = time.perf_counter()
+        analyze_batch(texts[i:i + batch_size], batch_size=batch_size)
+        latencies.append(time.perf_counter() - batch_start)
+    return summarize(latencies, len(texts), time.perf_counter() - start)
+
+
+def environment():
+    import torch
+    from models.models import model_ids
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "models": model_ids(),
+    }
+
+
+def run(args):
+    report = {"cold_start": cold_start()}
+    texts = load_texts(args.datasets, args.limit)
+    report["environment"] = environment()
+    report["texts"] = len(texts)
+    report["results"] = {}
+
+    from models import batching
+    for name in args.targets:
+        if name == "analyze_batch":
+            batching.enable(False)
+            for batch_size in args.batch_sizes:
+                key = f"analyze_batch@batch={batch_size}"
+                report["results"][key] = run_batched(texts, batch_size)
+                print_result(key, report["results"][key])
+            continue
+        for concurrency in args.concurrency:
+            key = f"{name}@concurrency={concurrency}"
+            # the shared tokenizers can't be called from several threads at once,
+            # so concurrent callers go through the micro-batchers
+            batching.enable(concurrency > 1)
+            report["results"][key] = run_single(get_target(name), texts, concurrency)
+            print_result(key, report["results"][key])
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def print_result(key, result):
+    print(
+        f"{key:<36} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+        f"p99 {result['p99_ms']:>8.2f} ms  {result['emails_per_sec']:>8.2f} emails/s"
+    )
+
+
+def compare(report, baseline, max_regression):
+    # a run regresses if p95 latency rises or throughput drops by more than max_regression
+    regressions = []
+    for key, result in report["results"].items():
+        if key not in baseline.get("results", {}):
+            continue
+        old = baseline["results"][key]
+        if result["p95_ms"] > old["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{key}: p95 {old['p95_ms']} -> {result['p95_ms']} ms")
+        if result["emails_per_sec"] < old["emails_per_sec"] * (1 - max_regression):
+            regressions.append(f"{key}: {old['emails_per_sec']} -> {result['emails_per_sec']} emails/s")
+    old_rss, new_rss = baseline.get("peak_rss_mb"), report["peak_rss_mb"]
+    if old_rss and new_rss > old_rss * (1 + max_regression):
+        regressions.append(f"peak rss {old_rss} -> {new_rss} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sentify analyzers on the bundled datasets")
+    parser.add_argument("--datasets", nargs="+", choices=list(datasets), default=list(datasets))
+    parser.add_argument("--targets", nargs="+", choices=single_targets + ["analyze_batch"],
+                        default=single_targets + ["analyze_batch"])
+    parser.add_argument("--limit", type=int, default=None, help="Emails to replay")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1], help="Threads calling each analyzer")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32], help="Batch sizes for analyze_batch")
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier --out")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Allowed relative slowdown against the baseline before failing")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"cold start: {report['cold_start']['load_seconds']}s to load, "
+          f"{report['cold_start']['first_call_seconds']}s first call; peak rss {report['peak_rss_mb']} MB")
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.compare)
+
+
+if __name__ == "__main__":
+    main()
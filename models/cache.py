@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from importlib import metadata
+
+from models import metrics, timing
+
+CACHE_DIR = os.environ.get("SENTIFY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sentify"))
+CACHE_ENABLED = os.environ.get("SENTIFY_CACHE", "1") != "0"
+# bump when the shape of cached results changes
+CACHE_VERSION = 2
+
+
+class LRUCache:
+    # in-memory tier, values are stored as json strings so callers can't mutate them
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SqliteCache:
+    # on-disk tier, evicts least recently used rows once the total size is over max_bytes
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(key) + len(value.encode("utf-8"))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.evict()
+
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache")
+
+
+class TieredCache:
+    # memory first, then disk; disk hits are promoted into memory
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def normalize_text(text):
+    # no Unicode normalization: byte-level BPE tokenizers (the formality RoBERTa) don't
+    # normalize, so NFC and NFD forms of a text can be classified differently
+    return text.replace("\r\n", "\n").strip()
+
+
+def library_versions():
+    versions = {}
+    for package in ("transformers", "torch", "nltk"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def make_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+analyze_cache = None
+analyze_cache_lock = threading.Lock()
+
+
+def get_analyze_cache():
+    global analyze_cache
+    with analyze_cache_lock:
+        if analyze_cache is None:
+            disk = None
+            try:
+                max_mb = float(os.environ.get("SENTIFY_CACHE_MAX_MB", "64"))
+                disk = SqliteCache(os.path.join(CACHE_DIR, "analyze.sqlite"), max_bytes=int(max_mb * 1024 * 1024))
+            except (OSError, sqlite3.Error):
+                # fall back to memory only (e.g. read-only home directory)
+                pass
+            analyze_cache = TieredCache(LRUCache(), disk)
+    return analyze_cache
+
+
+def cached_analyze(analyze_function, model_ids):
+    # wraps an analyze function so repeat calls on the same text are served from the cache
+    if not CACHE_ENABLED:
+        return analyze_function
+    versions = {"cache": CACHE_VERSION, "models": model_ids, "libraries": library_versions()}
+
+    def analyze(text):
+        cache = get_analyze_cache()
+        normalized = normalize_text(text)
+        key = make_key("analyze", normalized, versions)
+        with timing.span("cache_lookup"):
+            value = cache.get(key)
+        metrics.inc("sentify_cache_requests_total", cache="analyze", result="miss" if value is None else "hit")
+        if value is not None:
+            return json.loads(value)
+        # analyze the keyed text, so a later hit returns exactly what this miss computed
+        result = analyze_function(normalized)
+        cache.set(key, json.dumps(result))
+        return result
+
+    return analyze
@@ -0,0 +1,92 @@
+import http.client
+import json
+import os
+import socket
+from urllib.parse import urlparse
+
+
+class SentifyServerError(Exception):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class SentifyClient:
+    # Thin client for models/server.py. address is http://host:port or unix:///path/to/socket.
+    def __init__(self, address, timeout=300):
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self, timeout=None):
+        timeout = timeout or self.timeout
+        url = urlparse(self.address)
+        if url.scheme == "unix":
+            return UnixHTTPConnection(url.path, timeout=timeout)
+        return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+    def request(self, method, path, payload=None, timeout=None):
+        conn = self.connection(timeout)
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise SentifyServerError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def available(self):
+        try:
+            return self.request("GET", "/health", timeout=1).get("status") == "ok"
+        except (OSError, ValueError, SentifyServerError):
+            return False
+
+    def analyze(self, text):
+        return self.request("POST", "/analyze", {"text": text})
+
+    def analyze_batch(self, texts, batch_size=32):
+        return self.request("POST", "/analyze_batch", {"texts": list(texts), "batch_size": batch_size})["results"]
+
+    def formality(self, text, desired_formality=None):
+        return self.request("POST", "/formality", {"text": text, "desired_formality": desired_formality})
+
+    def formality_labels(self, sentences):
+        return self.request("POST", "/formality_labels", {"sentences": list(sentences)})["labels"]
+
+    def feedback(self, text, sentiment_data=None):
+        return self.request("POST", "/feedback", {"text": text, "sentiment_data": sentiment_data})["feedback"]
+
+    def generate(self, text, targets=None, feedback=None):
+        response = self.request("POST", "/generate", {"text": text, "targets": targets, "feedback": feedback})
+        return response["email"], response["analysis"]
+
+    def edit(self, text, detected_sentiment_data=None, target_sentiment_data=None):
+        return self.request(
+            "POST",
+            "/edit",
+            {
+                "text": text,
+                "detected_sentiment_data": detected_sentiment_data,
+                "target_sentiment_data": target_sentiment_data,
+            },
+        )
+
+
+def connect(address=None):
+    # returns a client if a server is configured (SENTIFY_SERVER) and answering, else None
+    address = address or os.environ.get("SENTIFY_SERVER")
+    if not address:
+        return None
+    client = SentifyClient(address)
+    return client if client.available() else None
@@ -0,0 +1,59 @@
+import os
+
+MAX_PROMPT_TOKENS = int(os.environ.get("SENTIFY_MAX_PROMPT_TOKENS", "6000"))
+
+encoding = None
+
+
+def count_tokens(text):
+    # tiktoken is optional; without it, estimate roughly 4 characters per token
+    global encoding
+    if encoding is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            encoding = False
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    # Messages sent to the chat model for one session. The system prompt is always
+    # kept; the oldest turns are dropped once the prompt would go over max_tokens
+    # (or max_messages, if set).
+    def __init__(self, system_prompt, max_tokens=MAX_PROMPT_TOKENS, max_messages=None):
+        self.system = {"role": "system", "content": system_prompt}
+        self.system_tokens = count_tokens(system_prompt)
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.turns = []
+        self.turn_tokens = []
+
+    def append(self, message):
+        self.turns.append(message)
+        self.turn_tokens.append(count_tokens(message["content"] or ""))
+        self.trim()
+
+    def trim(self):
+        # always keep the latest turn, even if it alone is over budget
+        while len(self.turns) > 1 and (
+            self.token_count() > self.max_tokens
+            or (self.max_messages is not None and len(self.turns) + 1 > self.max_messages)
+        ):
+            self.turns.pop(0)
+            self.turn_tokens.pop(0)
+
+    def token_count(self):
+        return self.system_tokens + sum(self.turn_tokens)
+
+    def messages(self):
+        return [self.system] + self.turns
+
+    def clear(self):
+        self.turns = []
+        self.turn_tokens = []
+
+    def __len__(self):
+        return len(self.turns) + 1
@@ -0,0 +1,59 @@
+import nltk
+from nltk.tokenize import sent_tokenize
+
+from models import registry, timing
+
+# Download once on first use (safe if already downloaded)
+registry.register("punkt_tab", lambda: nltk.download("punkt_tab", quiet=True))
+
+
+def split_sentences(text):
+    registry.get("punkt_tab")
+    with timing.span("split_sentences"):
+        return sent_tokenize(text)
+
+
+def sentence_spans(text, sentences):
+    # (start, end) character offsets of each sentence, searching on from the previous one
+    spans = []
+    position = 0
+    for sent in sentences:
+        start = text.find(sent, position)
+        if start < 0:
+            # not a verbatim slice of the text, leave an empty span where it would be
+            spans.append((position, position))
+            continue
+        spans.append((start, start + len(sent)))
+        position = start + len(sent)
+    return spans
+
+
+class Document:
+    # A text split into sentences once. Analyzers store per-sentence results under
+    # a name (e.g. "formality") and flag sentences by their (start, end) span, so
+    # renderers look a sentence's flag up instead of matching strings.
+    def __init__(self, text, sentences=None):
+        self.text = text
+        self.sentences = split_sentences(text) if sentences is None else list(sentences)
+        self.spans = sentence_spans(text, self.sentences)
+        self.results = {}
+        self.flags = {}
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def flag_for(self, index):
+        return self.flags.get(self.spans[index])
+
+    def segments(self):
+        # (text, flag) pieces covering the whole text in order; the text between
+        # sentences comes with flag None
+        position = 0
+        for index, (start, end) in enumerate(self.spans):
+            if start > position:
+                yield self.text[position:start], None
+            if end > start:
+                yield self.text[start:end], self.flag_for(index)
+            position = max(position, end)
+        if position < len(self.text):
+            yield self.text[position:], None
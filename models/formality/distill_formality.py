@@ -0,0 +1,172 @@
+# Distills the formality teacher into a smaller sentence classifier that
+# predict_formality.py can serve with SENTIFY_FORMALITY_MODEL=<out dir>.
+#
+# By default the student keeps the teacher's embeddings, tokenizer and classifier
+# and only --layers of its transformer layers, so it saves as a normal
+# AutoModelForSequenceClassification and works with the ONNX and INT8 paths.
+#
+# Examples:
+#   python -m models.formality.distill_formality --layers 3 --out out/formality-student
+#   python -m models.formality.distill_formality --student google/bert_uncased_L-4_H-256_A-4
+
+import argparse
+import copy
+import csv
+import json
+import os
+import random
+import time
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from models.document import split_sentences
+from models.formality.fine_tune_roberta_formality import dataset_id, load_splits
+from models.inference import predict_probs_batch
+from models.multitask.train_multitask import corpus_files, distillation_loss
+
+teacher_id = "rpangal/formality-roberta"
+
+
+def load_sentences(dataset_path=None, extra_text=None):
+    # formality is scored per sentence, so split the bundled emails into sentences
+    sentences = []
+    if dataset_path:
+        sentences.extend(load_splits(dataset_path)["train"]["text"])
+    for path, column in corpus_files:
+        with open(path, newline="", encoding="utf-8") as f:
+            sentences.extend(sent for row in csv.DictReader(f) for sent in split_sentences(row[column]))
+    if extra_text:
+        with open(extra_text, encoding="utf-8") as f:
+            sentences.extend(line.strip() for line in f if line.strip())
+    return list(dict.fromkeys(sentences))
+
+
+def truncated_student(teacher, layers):
+    # evenly spaced teacher layers, always including the first and the last
+    encoder_layers = teacher.base_model.encoder.layer
+    total = len(encoder_layers)
+    layers = min(layers, total)
+    keep = sorted({round(i * (total - 1) / max(layers - 1, 1)) for i in range(layers)})
+    student = copy.deepcopy(teacher)
+    student.base_model.encoder.layer = torch.nn.ModuleList(copy.deepcopy(encoder_layers[i]) for i in keep)
+    student.config.num_hidden_layers = len(keep)
+    return student
+
+
+def load_student(args, teacher, teacher_tokenizer):
+    if args.student is None:
+        return truncated_student(teacher, args.layers), teacher_tokenizer
+    id2label = teacher.config.id2label
+    student = AutoModelForSequenceClassification.from_pretrained(
+        args.student,
+        num_labels=len(id2label),
+        id2label=id2label,
+        label2id={label: i for i, label in id2label.items()},
+    )
+    return student, AutoTokenizer.from_pretrained(args.student)
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def predictions(tokenizer, model, texts, batch_size, max_length):
+    model.eval()
+    preds = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(texts[start:start + batch_size], return_tensors="pt",
+                               truncation=True, max_length=max_length, padding=True)
+            preds.extend(model(**inputs).logits.argmax(dim=1).tolist())
+    return preds
+
+
+def ms_per_sentence(tokenizer, model, texts, max_length):
+    # one sentence per call, as the GUI scores them while typing
+    model.eval()
+    start = time.perf_counter()
+    with torch.no_grad():
+        for text in texts:
+            model(**tokenizer(text, return_tensors="pt", truncation=True, max_length=max_length))
+    return (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+
+
+def train(args):
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    sentences = load_sentences(None if args.no_dataset else args.dataset, args.extra_text)
+    print(f"Labelling {len(sentences)} sentences with {args.teacher}...")
+    teacher_tokenizer = AutoTokenizer.from_pretrained(args.teacher)
+    teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher)
+    teacher.eval()
+    labels = torch.stack(predict_probs_batch(teacher_tokenizer, teacher, sentences, args.batch_size))
+
+    order = list(range(len(sentences)))
+    random.shuffle(order)
+    split = int(len(order) * (1 - args.eval_fraction))
+    train_idx, eval_idx = order[:split], order[split:]
+
+    student, tokenizer = load_student(args, teacher, teacher_tokenizer)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.learning_rate, weight_decay=0.01)
+
+    for epoch in range(args.epochs):
+        student.train()
+        random.shuffle(train_idx)
+        total_loss = 0.0
+        for start in range(0, len(train_idx), args.batch_size):
+            batch = train_idx[start:start + args.batch_size]
+            inputs = tokenizer([sentences[i] for i in batch], return_tensors="pt",
+                               truncation=True, max_length=args.max_length, padding=True)
+            loss = distillation_loss(student(**inputs).logits, labels[batch], args.temperature)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        print(f"epoch {epoch + 1}: loss={total_loss / len(train_idx):.4f}")
+
+    eval_sentences = [sentences[i] for i in eval_idx]
+    teacher_preds = labels[eval_idx].argmax(dim=1).tolist()
+    student_preds = predictions(tokenizer, student, eval_sentences, args.batch_size, args.max_length)
+    agreement = sum(s == t for s, t in zip(student_preds, teacher_preds)) / max(len(eval_idx), 1)
+    timed = eval_sentences[:args.timing_sentences]
+    report = {
+        "teacher": args.teacher,
+        "student": args.student or f"{args.teacher} ({student.config.num_hidden_layers} layers)",
+        "eval_sentences": len(eval_idx),
+        "agreement": round(agreement, 4),
+        "teacher_parameters": count_parameters(teacher),
+        "student_parameters": count_parameters(student),
+        "teacher_ms_per_sentence": round(ms_per_sentence(teacher_tokenizer, teacher, timed, args.max_length), 2),
+        "student_ms_per_sentence": round(ms_per_sentence(tokenizer, student, timed, args.max_length), 2),
+    }
+    print(f"agreement with teacher: {agreement:.2%} on {len(eval_idx)} held-out sentences")
+    print(f"parameters: {report['teacher_parameters']:,} -> {report['student_parameters']:,}")
+    print(f"ms per sentence: {report['teacher_ms_per_sentence']} -> {report['student_ms_per_sentence']}")
+
+    student.save_pretrained(args.out)
+    tokenizer.save_pretrained(args.out)
+    with open(os.path.join(args.out, "distillation_report.json"), "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Saved student to {args.out}, serve it with SENTIFY_FORMALITY_MODEL={args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the formality model into a smaller sentence classifier")
+    parser.add_argument("--teacher", default=teacher_id, help="Formality model to distill")
+    parser.add_argument("--layers", type=int, default=3, help="Teacher layers kept in the student")
+    parser.add_argument("--student", help="Pretrained encoder to train instead of a truncated teacher")
+    parser.add_argument("--out", default="out/formality-student", help="Output directory")
+    parser.add_argument("--dataset", default=dataset_id, help="Pavlick formality scores, hub id or a local copy")
+    parser.add_argument("--no-dataset", action="store_true", help="Only use sentences from the bundled csv files")
+    parser.add_argument("--extra-text", help="Optional file with additional unlabelled sentences, one per line")
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--eval-fraction", type=float, default=0.1)
+    parser.add_argument("--timing-sentences", type=int, default=200, help="Sentences used to time teacher and student")
+    parser.add_argument("--seed", type=int, default=42)
+    train(parser.parse_args())
@@ -1,20 +1,29 @@
 # Used help from https://achimoraites.medium.com/fine-tuning-roberta-for-topic-classification-with-hugging-face-transformers-and-datasets-library-c6f8432d0820
-
-from datasets import load_dataset, ClassLabel
+#
+# Examples:
+#   python -m models.formality.fine_tune_roberta_formality --push-to-hub
+#   python -m models.formality.fine_tune_roberta_formality --cpu --dataset path/to/pavlick-formality-scores
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+
+import torch
+from datasets import ClassLabel, load_dataset, load_from_disk
 from transformers import (
-    RobertaTokenizerFast,
-    RobertaForSequenceClassification,
-    TrainingArguments,
-    Trainer,
     AutoConfig,
+    AutoModelForSequenceClassification,
+    AutoTokenizer,
+    DataCollatorWithPadding,
+    Trainer,
+    TrainingArguments,
 )
-from huggingface_hub import whoami
 
 model_id = "roberta-base"
 dataset_id = "osyvokon/pavlick-formality-scores"
 repo_name = "formality-roberta"
-username = whoami()["name"]
-hub_model_id = f"{username}/{repo_name}"
 
 formality_feature = ClassLabel(
     num_classes=3,
@@ -31,73 +40,137 @@ def to_bucket(ex):
         lbl = 2
     return {"text": ex["sentence"], "label": lbl}
 
-dataset = load_dataset(dataset_id)
-
-dataset = dataset.map(
-    to_bucket,
-    remove_columns=["domain", "sentence", "avg_score"]
-)
-dataset = dataset.cast_column("label", formality_feature)
-dataset = dataset.rename_column("label", "labels")
-
-train_dataset = dataset["train"]
-test_dataset = dataset["test"].shard(num_shards=2, index=0)
-validation_dataset = dataset["test"].shard(num_shards=2, index=1)
-
-tokenizer = RobertaTokenizerFast.from_pretrained(model_id)
-def tokenize(batch):
-    return tokenizer(batch["text"], padding="max_length", truncation=True, max_length=128)
-
-train_dataset = train_dataset.map(tokenize, batched=True, batch_size=1000)
-val_dataset = validation_dataset.map(tokenize, batched=True, batch_size=1000)
-test_dataset = test_dataset.map(tokenize, batched=True, batch_size=1000)
-
-train_dataset.set_format("torch", columns=["input_ids","attention_mask","labels"])
-val_dataset.set_format("torch", columns=["input_ids","attention_mask","labels"])
-test_dataset.set_format("torch", columns=["input_ids","attention_mask","labels"])
-
-num_labels = dataset['train'].features['labels'].num_classes
-class_names = dataset["train"].features["labels"].names
-print(f"number of labels: {num_labels}")
-print(f"the labels: {class_names}")
-
-id2label = {i: label for i, label in enumerate(class_names)}
-
-config = AutoConfig.from_pretrained(model_id)
-config.update({"id2label": id2label})
-
-model = RobertaForSequenceClassification.from_pretrained(model_id, config=config)
-
-# TrainingArguments
-training_args = TrainingArguments(
-    output_dir="out/formality_reg",
-    num_train_epochs=2,
-    per_device_train_batch_size=16,
-    per_device_eval_batch_size=16,
-    learning_rate=2e-5,
-    weight_decay=0.05,
-    warmup_steps=500,
-    save_strategy="epoch",
-    eval_strategy="epoch",
-    load_best_model_at_end=True,
-    save_total_limit=2,
-    report_to="tensorboard",
-    push_to_hub=True,
-    hub_model_id=hub_model_id,
-    hub_strategy="end",
-    fp16=True,
-)
-
-# Trainer
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_dataset,
-    eval_dataset=val_dataset,
-)
+def load_raw_dataset(dataset_path):
+    # a hub id, a directory written by save_to_disk, or anything load_dataset reads
+    if os.path.exists(os.path.join(dataset_path, "dataset_dict.json")):
+        return load_from_disk(dataset_path)
+    return load_dataset(dataset_path)
+
+def load_splits(dataset_path=dataset_id):
+    dataset = load_raw_dataset(dataset_path)
+    dataset = dataset.map(
+        to_bucket,
+        remove_columns=["domain", "sentence", "avg_score"]
+    )
+    dataset = dataset.cast_column("label", formality_feature)
+    dataset = dataset.rename_column("label", "labels")
+    return {
+        "train": dataset["train"],
+        "test": dataset["test"].shard(num_shards=2, index=0),
+        "validation": dataset["test"].shard(num_shards=2, index=1),
+    }
+
+def tokenized_splits(tokenizer, model_name, dataset_path=dataset_id, cache_dir="out/formality_data", max_length=128):
+    # Tokenized splits are saved as Arrow files and memory-mapped by load_from_disk,
+    # so later runs skip tokenization. Nothing is padded here: the Pavlick sentences
+    # are short and the collator pads each batch to its own longest sentence.
+    name = re.sub(r"[^\w.-]+", "_", f"{dataset_path}-{model_name}-{max_length}")
+    path = os.path.join(cache_dir, name)
+    if not os.path.exists(path):
+        def tokenize(batch):
+            return tokenizer(batch["text"], truncation=True, max_length=max_length)
+
+        # written to a temporary directory and renamed once every split is saved,
+        # so a run killed halfway doesn't leave a cache that later runs trust
+        os.makedirs(cache_dir, exist_ok=True)
+        partial_path = tempfile.mkdtemp(prefix=f"{name}.", suffix=".partial", dir=cache_dir)
+        try:
+            for split, data in load_splits(dataset_path).items():
+                data = data.map(tokenize, batched=True, batch_size=1000, remove_columns=["text"])
+                data.save_to_disk(os.path.join(partial_path, split))
+            if os.path.exists(path):
+                # another run finished the same cache first
+                shutil.rmtree(partial_path)
+            else:
+                os.rename(partial_path, path)
+        except BaseException:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            raise
+    return {split: load_from_disk(os.path.join(path, split)) for split in ["train", "validation", "test"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune RoBERTa on the Pavlick formality scores")
+    parser.add_argument("--model", default=model_id, help="Base model to fine-tune")
+    parser.add_argument("--dataset", default=dataset_id, help="Hub dataset id or a local copy of it")
+    parser.add_argument("--output-dir", default="out/formality_reg")
+    parser.add_argument("--cache-dir", default="out/formality_data", help="Where the tokenized splits are cached")
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--epochs", type=float, default=2)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--report-to", default="tensorboard", help="Trainer logging integration, or \"none\"")
+    parser.add_argument("--cpu", action="store_true", help="Train on the CPU even if a GPU is available")
+    parser.add_argument("--push-to-hub", action="store_true", help=f"Push the model to <your user>/{repo_name}")
+    parser.add_argument("--hub-model-id", help="Hub repo to push to instead")
+    args = parser.parse_args()
+
+    hub_model_id = args.hub_model_id
+    if args.push_to_hub and hub_model_id is None:
+        # only needs a hub login when pushing
+        from huggingface_hub import whoami
+        hub_model_id = f"{whoami()['name']}/{repo_name}"
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    splits = tokenized_splits(tokenizer, args.model, args.dataset, args.cache_dir, args.max_length)
+    train_dataset = splits["train"]
+    val_dataset = splits["validation"]
+
+    num_labels = train_dataset.features['labels'].num_classes
+    class_names = train_dataset.features["labels"].names
+    print(f"number of labels: {num_labels}")
+    print(f"the labels: {class_names}")
+
+    id2label = {i: label for i, label in enumerate(class_names)}
+
+    config = AutoConfig.from_pretrained(args.model)
+    config.update({"id2label": id2label, "label2id": {label: i for i, label in id2label.items()}})
+
+    model = AutoModelForSequenceClassification.from_pretrained(args.model, config=config)
+
+    fp16 = torch.cuda.is_available() and not args.cpu
+    # batches of similar length, so the dynamic padding stays short
+    # (transformers 5 replaced group_by_length with train_sampling_strategy)
+    if "train_sampling_strategy" in TrainingArguments.__dataclass_fields__:
+        length_grouping = {"train_sampling_strategy": "group_by_length"}
+    else:
+        length_grouping = {"group_by_length": True}
+    # TrainingArguments
+    training_args = TrainingArguments(
+        output_dir=args.output_dir,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.batch_size,
+        learning_rate=2e-5,
+        weight_decay=0.05,
+        warmup_steps=500,
+        save_strategy="epoch",
+        eval_strategy="epoch",
+        load_best_model_at_end=True,
+        save_total_limit=2,
+        report_to=args.report_to,
+        push_to_hub=args.push_to_hub,
+        hub_model_id=hub_model_id,
+        hub_strategy="end",
+        use_cpu=args.cpu,
+        fp16=fp16,
+        **length_grouping,
+    )
+
+    # Trainer
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        data_collator=DataCollatorWithPadding(tokenizer, pad_to_multiple_of=8 if fp16 else None),
+    )
 
-if __name__ == "__main__":
     trainer.train()
-    trainer.push_to_hub()
-    tokenizer.push_to_hub(hub_model_id)
+    if args.push_to_hub:
+        trainer.push_to_hub()
+        tokenizer.push_to_hub(hub_model_id)
+    else:
+        trainer.save_model(args.output_dir)
+        tokenizer.save_pretrained(args.output_dir)
 
+if __name__ == "__main__":
+    main()
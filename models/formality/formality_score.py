@@ -0,0 +1,27 @@
+# Map labels to scores
+label_to_score = {"informal": 0, "neutral": 0.5, "formal": 1.0}
+
+
+def score_sentences(sentences, labels):
+    total_length = sum(len(s) for s in sentences)
+
+    results = []
+    weighted_score = 0.0
+
+    for sent, label in zip(sentences, labels):
+        score = label_to_score.get(label, 0.5)
+        weight = len(sent) / total_length if total_length else 0
+        weighted_score += score * weight
+        results.append((sent, label, round(score, 2)))
+
+    classification = (
+        "formal"
+        if weighted_score > 0.75
+        else "neutral" if weighted_score > 0.4 else "informal"
+    )
+
+    return {
+        "sentences": results,
+        "weighted_formality_score": round(weighted_score, 3),
+        "classification": classification,
+    }
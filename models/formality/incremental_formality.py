@@ -0,0 +1,44 @@
+from models.document import Document, split_sentences
+from models.formality.predict_formality import getformality_batch
+from models.formality.sentence_level_formality import flag_document, score_document
+
+
+class FormalityDocument:
+    # Keeps the per-sentence formality labels of a draft between edits, so each
+    # update only classifies the sentences that changed since the last version.
+    # classify maps a list of sentences to their labels (e.g. a server client's).
+    def __init__(self, text="", classify=getformality_batch):
+        self.classify = classify
+        self.sentences = []
+        self.labels = {}
+        self.document = Document("", [])
+        if text:
+            self.update(text)
+
+    def update(self, text):
+        sentences = split_sentences(text)
+
+        new_sentences = [sent for sent in dict.fromkeys(sentences) if sent not in self.labels]
+        if new_sentences:
+            labels = self.classify(new_sentences)
+            self.labels.update((sent, label.lower()) for sent, label in zip(new_sentences, labels))
+
+        # keep labels for the previous and current version only, so undoing an edit is free
+        keep = set(self.sentences) | set(sentences)
+        self.labels = {sent: label for sent, label in self.labels.items() if sent in keep}
+        self.sentences = sentences
+        # a new document per version, so one handed out earlier keeps its text and flags
+        self.document = Document(text, sentences)
+        self.document.results["formality"] = self.sentence_labels()
+        return self.formality()
+
+    def sentence_labels(self):
+        return [self.labels[sent] for sent in self.sentences]
+
+    def formality(self):
+        # same result as get_sentence_formality on the current text
+        return score_document(self.document)
+
+    def nomatch(self, desired_formality):
+        # same result as get_nomatch_formality on the current text
+        return flag_document(self.document, desired_formality)
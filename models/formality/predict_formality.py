@@ -1,17 +1,31 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+import os
 
-MODEL_REPO = "rpangal/formality-roberta"
+from models import onnx_backend, quantization, registry
+from models.batching import MicroBatcher
+from models.inference import classify_batch
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_REPO)
-model     = AutoModelForSequenceClassification.from_pretrained(MODEL_REPO)
+# a distilled student from distill_formality.py can be served instead
+MODEL_REPO = os.environ.get("SENTIFY_FORMALITY_MODEL", "rpangal/formality-roberta")
 
-classifier = pipeline(
-    "text-classification",
-    model=model,
-    tokenizer=tokenizer,
-    device=0
-)
+def load_formality_model():
+    if onnx_backend.enabled():
+        return onnx_backend.load("formality")
+    with registry.import_lock:
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_REPO)
+    model     = AutoModelForSequenceClassification.from_pretrained(MODEL_REPO)
+    if quantization.enabled("formality", MODEL_REPO):
+        model = quantization.quantize(model)
+    return tokenizer, model
 
-def getformality(text):
-    result = classifier(text)
-    return result[0]["label"]
\ No newline at end of file
+registry.register("formality", load_formality_model)
+
+def getformality_batch(texts, batch_size=32):
+    return formality_batcher(texts, batch_size)
+
+def run_formality_batch(texts, batch_size=32):
+    tokenizer, model = registry.get("formality")
+    results = classify_batch(tokenizer, model, texts, batch_size)
+    return [model.config.id2label[pred] for pred, _ in results]
+
+formality_batcher = MicroBatcher(run_formality_batch, "formality")
@@ -1,59 +1,72 @@
-import nltk
-from nltk.tokenize import sent_tokenize
-from models.formality.predict_formality import getformality
+from models.document import Document
+from models.formality.predict_formality import getformality_batch
+from models.formality.formality_score import score_sentences
 
-# Download once (safe if already downloaded)
-nltk.download("punkt_tab", quiet=True)
 
-# Map labels to scores
-label_to_score = {"informal": 0, "neutral": 0.5, "formal": 1.0}
+def get_sentence_formality(text: str):
+    return score_document(Document(text))
 
 
-def get_sentence_formality(text: str):
-    sentences = sent_tokenize(text)
-    total_length = sum(len(s) for s in sentences)
-
-    results = []
-    weighted_score = 0.0
-
-    for sent in sentences:
-        label = getformality(
-            sent
-        ).lower()  # called pipeline from existing formality code
-        score = label_to_score.get(label, 0.5)
-        weight = len(sent) / total_length if total_length else 0
-        weighted_score += score * weight
-        results.append((sent, label, round(score, 2)))
-
-    classification = (
-        "formal"
-        if weighted_score > 0.75
-        else "neutral" if weighted_score > 0.4 else "informal"
-    )
+def get_sentence_formality_batch(texts, batch_size=32):
+    # classify the sentences of every text in one batched call
+    documents = [Document(text) for text in texts]
+    all_sentences = [sent for document in documents for sent in document.sentences]
+    all_labels = classify_sentences(all_sentences, batch_size)
+
+    start = 0
+    for document in documents:
+        document.results["formality"] = all_labels[start:start + len(document)]
+        start += len(document)
+    return [score_document(document) for document in documents]
+
+
+def classify_document(document, batch_size=32):
+    # labels are stored on the document, so scoring and flagging it classify only once
+    if "formality" not in document.results:
+        document.results["formality"] = classify_sentences(document.sentences, batch_size)
+    return document.results["formality"]
+
+
+def score_document(document):
+    return score_sentences(document.sentences, classify_document(document))
 
-    return {
-        "sentences": results,
-        "weighted_formality_score": round(weighted_score, 3),
-        "classification": classification,
-    }
+
+def classify_sentences(sentences, batch_size=32):
+    # run each distinct sentence through the classifier once (e.g. repeated "Thanks,")
+    unique = list(dict.fromkeys(sentences))
+    labels = dict(zip(unique, getformality_batch(unique, batch_size)))
+    return [labels[sent].lower() for sent in sentences]
 
 
 def get_nomatch_formality(text: str, desired_formality: str):
-    sentences = sent_tokenize(text)
-    flagged_sentences = []
+    return flag_document(Document(text), desired_formality)
+
+
+def flag_document(document, desired_formality):
+    # flags are also stored on the document by sentence span
+    document.flags = {}
+    flagged_sentences = flag_sentences(
+        document.sentences, classify_document(document), desired_formality, document.spans
+    )
+    for item in flagged_sentences:
+        document.flags[(item["start"], item["end"])] = item
+    return flagged_sentences
 
-    for sent in sentences:
-        detected_formality = getformality(sent).lower()
-        desired_formality = desired_formality.lower()
 
+def flag_sentences(sentences, labels, desired_formality, spans=None):
+    desired_formality = desired_formality.lower()
+    flagged_sentences = []
+
+    for i, (sent, detected_formality) in enumerate(zip(sentences, labels)):
         if detected_formality != desired_formality:
-            flagged_sentences.append(
-                {
-                    "sentence": sent,
-                    "detected_formality": detected_formality,
-                    "issue": f"Sentence formality '{detected_formality}' does not match desired formality '{desired_formality}'.",
-                }
-            )
+            item = {
+                "sentence": sent,
+                "detected_formality": detected_formality,
+                "issue": f"Sentence formality '{detected_formality}' does not match desired formality '{desired_formality}'.",
+            }
+            if spans is not None:
+                item["start"], item["end"] = spans[i]
+            flagged_sentences.append(item)
 
     return flagged_sentences
 
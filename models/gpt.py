@@ -1,7 +1,16 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
 import openai
 import keys
 import json
 from json_repair import repair_json
+from models.cache import CACHE_DIR, SqliteCache, make_key
+from models.conversation import Conversation
+from models import metrics, timing
 ai_model_name = "gpt-4o"
 feedback_instructions = """
     You are an email coach assistant that provides constructive feedback on emails.
@@ -80,15 +89,78 @@ functions = [
 
 speech_key = keys.azure_key
 service_region = keys.azure_region
-client = openai.AzureOpenAI(
-    azure_endpoint=keys.azure_openai_endpoint,
-    api_key=keys.azure_openai_key,
-    api_version=keys.azure_openai_api_version,
-)
-feedback_discourse = [{"role": "system", "content": feedback_instructions}]
-generation_discourse = [{"role": "system", "content": gen_email_instructions}]
 
-def gpt_feedback(text, sentiment_data, discourse=feedback_discourse):
+def make_client(async_client=False):
+    base_url = os.environ.get("SENTIFY_OPENAI_BASE_URL")
+    if base_url:
+        # any OpenAI-compatible server, e.g. a local stub for testing
+        client_class = openai.AsyncOpenAI if async_client else openai.OpenAI
+        return client_class(base_url=base_url, api_key=os.environ.get("SENTIFY_OPENAI_API_KEY", "stub"))
+    client_class = openai.AsyncAzureOpenAI if async_client else openai.AzureOpenAI
+    return client_class(
+        azure_endpoint=keys.azure_openai_endpoint,
+        api_key=keys.azure_openai_key,
+        api_version=keys.azure_openai_api_version,
+    )
+
+client = make_client()
+# async clients hold connections bound to an event loop, so keep one per loop
+async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in async_clients:
+        async_clients[loop] = make_client(async_client=True)
+    return async_clients[loop]
+
+# exact-match cache of llm outputs (SENTIFY_LLM_CACHE=0 turns it off)
+LLM_CACHE_ENABLED = os.environ.get("SENTIFY_LLM_CACHE", "1") != "0"
+llm_cache = None
+llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    global llm_cache
+    with llm_cache_lock:
+        if llm_cache is None:
+            try:
+                llm_cache = SqliteCache(
+                    os.path.join(CACHE_DIR, "llm.sqlite"),
+                    max_bytes=int(float(os.environ.get("SENTIFY_LLM_CACHE_MAX_MB", "32")) * 1024 * 1024),
+                    ttl=float(os.environ.get("SENTIFY_LLM_CACHE_TTL", 7 * 24 * 3600)),
+                )
+            except (OSError, sqlite3.Error):
+                llm_cache = False
+    return llm_cache or None
+
+def llm_cache_lookup(request, use_cache=True):
+    # request holds the model, messages and function schema; returns (key, cached output)
+    cache = get_llm_cache() if use_cache and LLM_CACHE_ENABLED else None
+    if cache is None:
+        return None, None
+    key = make_key("chat", request)
+    output = cache.get(key)
+    metrics.inc("sentify_cache_requests_total", cache="llm", result="miss" if output is None else "hit")
+    return key, output
+
+def llm_cache_store(key, output):
+    if key is not None and output is not None:
+        get_llm_cache().set(key, output)
+
+def record_usage(call, usage):
+    # usage is the token count block of a completion (or the last chunk of a stream)
+    metrics.inc("sentify_llm_requests_total", call=call)
+    if usage is not None:
+        metrics.inc("sentify_llm_tokens_total", usage.prompt_tokens, call=call, kind="prompt")
+        metrics.inc("sentify_llm_tokens_total", usage.completion_tokens, call=call, kind="completion")
+
+def new_feedback_discourse():
+    # feedback keeps at most the last 10 requests, like it always has
+    return Conversation(feedback_instructions, max_messages=11)
+
+def new_generation_discourse():
+    return Conversation(gen_email_instructions)
+
+def feedback_prompt(text, sentiment_data):
     input_format = f"""
         Email Text:
         ------
@@ -104,15 +176,70 @@ def gpt_feedback(text, sentiment_data, discourse=feedback_discourse):
 
         Please provide specific, actionable feedback to improve this email.
     """
-    discourse.append({"role": "user", "content": input_format})
-    response = client.chat.completions.create(model=ai_model_name, messages=discourse)
-    reply = response.choices[0].message.content
-    # trim discourse to not be too large
-    if len(discourse) > 10:
-        discourse.pop(1)
+    return input_format
+
+def gpt_feedback(text, sentiment_data, discourse=None, use_cache=True):
+    # pass the session's conversation to keep context between calls
+    discourse = discourse if discourse is not None else new_feedback_discourse()
+    discourse.append({"role": "user", "content": feedback_prompt(text, sentiment_data)})
+    request = {"model": ai_model_name, "messages": discourse.messages()}
+    key, reply = llm_cache_lookup(request, use_cache)
+    if reply is None:
+        with timing.span("azure:feedback"):
+            response = client.chat.completions.create(**request)
+        record_usage("feedback", response.usage)
+        reply = response.choices[0].message.content
+        llm_cache_store(key, reply)
+    return reply
+
+async def gpt_feedback_async(text, sentiment_data, discourse=None, use_cache=True):
+    discourse = discourse if discourse is not None else new_feedback_discourse()
+    discourse.append({"role": "user", "content": feedback_prompt(text, sentiment_data)})
+    request = {"model": ai_model_name, "messages": discourse.messages()}
+    key, reply = llm_cache_lookup(request, use_cache)
+    if reply is None:
+        with timing.span("azure:feedback"):
+            response = await get_async_client().chat.completions.create(**request)
+        record_usage("feedback", response.usage)
+        reply = response.choices[0].message.content
+        llm_cache_store(key, reply)
     return reply
 
-def gpt_generate_and_analyze(text, analyze_function, targets=None, discourse=generation_discourse, feedback=None, discourse_append=False):
+def stream_completion(messages, call="stream"):
+    # yields the reply text as it arrives
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    response = client.chat.completions.create(
+        model=ai_model_name, messages=messages, stream=True, stream_options={"include_usage": True}
+    )
+    for chunk in response:
+        # the last chunk carries the token usage and no choices
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        # azure sends a first chunk with no choices (content filter results)
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token is None:
+                first_token = time.perf_counter() - start
+                timing.add("azure:stream_first_token", first_token)
+            yield chunk.choices[0].delta.content
+    timing.add("azure:stream", time.perf_counter() - start)
+    record_usage(call, usage)
+
+def gpt_feedback_stream(text, sentiment_data, discourse=None, use_cache=True):
+    discourse = discourse if discourse is not None else new_feedback_discourse()
+    discourse.append({"role": "user", "content": feedback_prompt(text, sentiment_data)})
+    key, reply = llm_cache_lookup({"model": ai_model_name, "messages": discourse.messages()}, use_cache)
+    if reply is not None:
+        yield reply
+    else:
+        chunks = []
+        for chunk in stream_completion(discourse.messages(), "feedback"):
+            chunks.append(chunk)
+            yield chunk
+        llm_cache_store(key, "".join(chunks))
+
+def generation_prompt(text, targets=None, feedback=None):
     input_format = f"""
     Text to use to generate the email:
     {text}
@@ -131,18 +258,47 @@ def gpt_generate_and_analyze(text, analyze_function, targets=None, discourse=gen
         We have generated feedback for the user and the user wants us to implement it with the current email. The feedback is written as follows:
         {feedback}
 """
+    return input_format
+
+def gpt_generate_and_analyze(text, analyze_function, targets=None, discourse=None, feedback=None, discourse_append=False):
+    discourse = discourse if discourse is not None else new_generation_discourse()
+    input_format = generation_prompt(text, targets, feedback)
     if discourse_append:
         discourse.append({"role": "user", "content": input_format})
         sentiment_data = analyze_function(text)
         return text, sentiment_data
     
     discourse.append({"role": "user", "content": input_format})
-    response = client.chat.completions.create(model=ai_model_name, messages = discourse)
+    with timing.span("azure:generate"):
+        response = client.chat.completions.create(model=ai_model_name, messages = discourse.messages())
+    record_usage("generate", response.usage)
     generated_email = response.choices[0].message.content.strip()
     sentiment_data = analyze_function(generated_email)
     return generated_email, sentiment_data
 
-def gpt_edit_email(text, detected_sentiment_data, target_sentiment_data=None):
+def gpt_generate_stream(text, targets=None, discourse=None, feedback=None):
+    # streaming version of gpt_generate_and_analyze, the caller analyzes the joined text
+    discourse = discourse if discourse is not None else new_generation_discourse()
+    discourse.append({"role": "user", "content": generation_prompt(text, targets, feedback)})
+    yield from stream_completion(discourse.messages(), "generate")
+
+async def gpt_generate_and_analyze_async(text, analyze_function, targets=None, discourse=None, feedback=None, discourse_append=False):
+    discourse = discourse if discourse is not None else new_generation_discourse()
+    input_format = generation_prompt(text, targets, feedback)
+    discourse.append({"role": "user", "content": input_format})
+    if discourse_append:
+        sentiment_data = await asyncio.to_thread(analyze_function, text)
+        return text, sentiment_data
+
+    with timing.span("azure:generate"):
+        response = await get_async_client().chat.completions.create(model=ai_model_name, messages=discourse.messages())
+    record_usage("generate", response.usage)
+    generated_email = response.choices[0].message.content.strip()
+    # local classifiers run in a worker thread so the event loop stays free
+    sentiment_data = await asyncio.to_thread(analyze_function, generated_email)
+    return generated_email, sentiment_data
+
+def edit_email_messages(text, detected_sentiment_data, target_sentiment_data=None):
     messages = [
         {"role": "system", "content": edit_email_instructions},
     ]
@@ -196,15 +352,62 @@ def gpt_edit_email(text, detected_sentiment_data, target_sentiment_data=None):
         """
 
     messages.append({"role": "user", "content": user_prompt})
-    response = client.chat.completions.create(
-        model=ai_model_name,
-        messages=messages,
-        functions=functions,
-        function_call={"name": "edit_email"},
-    )
-    fn_call = response.choices[0].message.function_call
+    return messages
+
+def parse_edit_arguments(arguments):
     try:
-        output = json.loads(fn_call.arguments)
+        output = json.loads(arguments)
     except json.JSONDecodeError:
-        output = repair_json(fn_call.arguments)
+        output = repair_json(arguments)
     return output
+
+def edit_email_request(text, detected_sentiment_data, target_sentiment_data=None):
+    return {
+        "model": ai_model_name,
+        "messages": edit_email_messages(text, detected_sentiment_data, target_sentiment_data),
+        "functions": functions,
+        "function_call": {"name": "edit_email"},
+    }
+
+def gpt_edit_email(text, detected_sentiment_data, target_sentiment_data=None, use_cache=True):
+    request = edit_email_request(text, detected_sentiment_data, target_sentiment_data)
+    key, arguments = llm_cache_lookup(request, use_cache)
+    if arguments is None:
+        with timing.span("azure:edit"):
+            response = client.chat.completions.create(**request)
+        record_usage("edit", response.usage)
+        arguments = response.choices[0].message.function_call.arguments
+        llm_cache_store(key, arguments)
+    return parse_edit_arguments(arguments)
+
+async def gpt_edit_email_async(text, detected_sentiment_data, target_sentiment_data=None, use_cache=True):
+    request = edit_email_request(text, detected_sentiment_data, target_sentiment_data)
+    key, arguments = llm_cache_lookup(request, use_cache)
+    if arguments is None:
+        with timing.span("azure:edit"):
+            response = await get_async_client().chat.completions.create(**request)
+        record_usage("edit", response.usage)
+        arguments = response.choices[0].message.function_call.arguments
+        llm_cache_store(key, arguments)
+    return parse_edit_arguments(arguments)
+
+async def analyze_with_ai_async(text, analyze_function, ai_feedback=False, ai_generation=False):
+    # Runs the local analysis and the requested LLM calls, overlapping whatever
+    # doesn't depend on each other. Returns (results, feedback, generated email).
+    analysis = asyncio.create_task(asyncio.to_thread(analyze_function, text))
+    generation = None
+    if ai_generation and not ai_feedback:
+        # generation without feedback only needs the text, so it can start right away
+        generation = asyncio.create_task(gpt_generate_and_analyze_async(text, analyze_function))
+
+    results = await analysis
+    feedback = None
+    if ai_feedback:
+        feedback = await gpt_feedback_async(text, results)
+        if ai_generation:
+            generation = asyncio.create_task(gpt_generate_and_analyze_async(text, analyze_function, feedback=True))
+
+    gen_email = None
+    if generation is not None:
+        gen_email, _ = await generation
+    return results, feedback, gen_email
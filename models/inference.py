@@ -0,0 +1,75 @@
+import os
+
+import torch
+
+from models import timing, tokenization
+
+# long texts are split into overlapping windows whose logits are averaged
+# (SENTIFY_LONG_TEXT=truncate keeps only the first max-length tokens instead)
+WINDOWED = os.environ.get("SENTIFY_LONG_TEXT", "window") == "window"
+WINDOW_TOKENS = int(os.environ.get("SENTIFY_WINDOW_TOKENS", "512"))
+WINDOW_STRIDE = int(os.environ.get("SENTIFY_WINDOW_STRIDE", "64"))
+
+
+def length_buckets(lengths, batch_size):
+    # sort by length so each batch pads to roughly the same size
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def classify_batch(tokenizer, model, texts, batch_size=32):
+    # returns (predicted index, confidence) for each text, in input order
+    results = []
+    for probs in predict_probs_batch(tokenizer, model, texts, batch_size):
+        confidence, pred = torch.max(probs, dim=0)
+        results.append((pred.item(), confidence.item()))
+    return results
+
+
+def encode(tokenizer, texts, windowed=None):
+    # returns the encodings and, for each encoded row, the index of the text it belongs to;
+    # texts already encoded by a tokenizer with the same vocabulary come from the cache
+    if windowed is None:
+        windowed = WINDOWED
+    windowed = windowed and tokenizer.is_fast
+    settings = (windowed, tokenizer.model_max_length, WINDOW_TOKENS, WINDOW_STRIDE)
+    return tokenization.cached_encode(tokenizer, texts, lambda missing: tokenize(tokenizer, missing, windowed), settings)
+
+
+def tokenize(tokenizer, texts, windowed):
+    if windowed:
+        max_length = min(WINDOW_TOKENS, tokenizer.model_max_length)
+        encodings = tokenizer(
+            list(texts),
+            truncation=True,
+            max_length=max_length,
+            stride=min(WINDOW_STRIDE, max_length // 2),
+            return_overflowing_tokens=True,
+        )
+        return encodings, encodings.pop("overflow_to_sample_mapping")
+    return tokenizer(list(texts), truncation=True), list(range(len(texts)))
+
+
+def predict_probs_batch(tokenizer, model, texts, batch_size=32, windowed=None):
+    # returns the softmax distribution for each text, in input order; the windows of a
+    # long text run in the same batches as everything else and their logits are averaged
+    if not texts:
+        return []
+    with timing.span("tokenize"):
+        encodings, owners = encode(tokenizer, texts, windowed)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    logit_sums = [0] * len(texts)
+    windows = [0] * len(texts)
+
+    for bucket in length_buckets(lengths, batch_size):
+        with timing.span("tokenize"):
+            features = [{key: encodings[key][i] for key in encodings.keys()} for i in bucket]
+            inputs = tokenizer.pad(features, return_tensors="pt").to(model.device)
+        with timing.span("forward"), torch.no_grad():
+            outputs = model(**inputs)
+        logits = outputs.logits.float().cpu()
+        for row, i in enumerate(bucket):
+            logit_sums[owners[i]] = logits[row] + logit_sums[owners[i]]
+            windows[owners[i]] += 1
+    return [torch.nn.functional.softmax(total / count, dim=0) for total, count in zip(logit_sums, windows)]
@@ -1,14 +1,45 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
+from models import batching, inference, onnx_backend, quantization, registry, timing
+from models.batching import MicroBatcher
+from models.inference import classify_batch
+
+MODEL_REPO = "parvk11/intent_classification_model"
+reverse_label_map = {0: 'follow-up', 1: 'request', 2: 'inform'}
+
+def load_intent_model():
+    if onnx_backend.enabled():
+        return onnx_backend.load("intent")
+    with registry.import_lock:
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    intent_tokenizer = AutoTokenizer.from_pretrained(MODEL_REPO)
+    intent_model = AutoModelForSequenceClassification.from_pretrained(MODEL_REPO)
+    if quantization.enabled("intent", MODEL_REPO):
+        intent_model = quantization.quantize(intent_model)
+    return intent_tokenizer, intent_model
+
+registry.register("intent", load_intent_model)
 
-intent_tokenizer = AutoTokenizer.from_pretrained("parvk11/intent_classification_model")
-intent_model = AutoModelForSequenceClassification.from_pretrained("parvk11/intent_classification_model")
 def get_intent(text):
-    inputs = intent_tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
+    # the batch path also handles texts longer than the model's max length
+    if batching.ENABLED or inference.WINDOWED:
+        return get_intent_batch([text])[0]
+    intent_tokenizer, intent_model = registry.get("intent")
+    with timing.span("tokenize"):
+        encodings, _ = inference.encode(intent_tokenizer, [text], windowed=False)
+        inputs = intent_tokenizer.pad(encodings, return_tensors="pt")
+    with timing.span("forward"), torch.no_grad():
         outputs = intent_model(**inputs)
     probs = torch.nn.functional.softmax(outputs.logits, dim=1)
     pred = torch.argmax(probs, dim=1).item()
     confidence = probs[0][pred].item()
-    reverse_label_map = {0: 'follow-up', 1: 'request', 2: 'inform'}
-    return reverse_label_map[pred], confidence
\ No newline at end of file
+    return reverse_label_map[pred], confidence
+
+def get_intent_batch(texts, batch_size=32):
+    return intent_batcher(texts, batch_size)
+
+def run_intent_batch(texts, batch_size=32):
+    intent_tokenizer, intent_model = registry.get("intent")
+    results = classify_batch(intent_tokenizer, intent_model, texts, batch_size)
+    return [(reverse_label_map[pred], confidence) for pred, confidence in results]
+
+intent_batcher = MicroBatcher(run_intent_batch, "intent")
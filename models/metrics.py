@@ -0,0 +1,138 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt-in process metrics in Prometheus text format. SENTIFY_METRICS=1 records them;
+# SENTIFY_METRICS_PORT also serves them on http://127.0.0.1:<port>/metrics.
+PORT = os.environ.get("SENTIFY_METRICS_PORT")
+ENABLED = os.environ.get("SENTIFY_METRICS", "0") == "1" or bool(PORT)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# name -> (type, help, histogram buckets)
+definitions = {
+    "sentify_stage_seconds": ("histogram", "Time spent in each timed stage (see models/timing.py)", LATENCY_BUCKETS),
+    "sentify_model_load_seconds": ("gauge", "Time taken to load each model or resource", None),
+    "sentify_llm_requests_total": ("counter", "Chat completion requests sent to Azure OpenAI", None),
+    "sentify_llm_tokens_total": ("counter", "Prompt and completion tokens reported by Azure OpenAI", None),
+    "sentify_cache_requests_total": ("counter", "Cache lookups by cache and result", None),
+    "sentify_batch_size": ("histogram", "Items per micro-batch run by each model", SIZE_BUCKETS),
+    "sentify_queue_depth": ("gauge", "Requests waiting in each micro-batch queue", None),
+}
+
+lock = threading.Lock()
+# name -> {label tuple: value}; histograms store [bucket counts..., sum, count]
+values = {name: {} for name in definitions}
+# name -> [(label tuple, function)] for gauges read when rendering
+gauge_functions = {name: [] for name in definitions}
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    if not ENABLED:
+        return
+    buckets = definitions[name][2]
+    key = label_key(labels)
+    with lock:
+        entry = values[name].setdefault(key, [0] * (len(buckets) + 2))
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    if not ENABLED:
+        return
+    key = label_key(labels)
+    with lock:
+        values[name][key] = values[name].get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    if not ENABLED:
+        return
+    with lock:
+        values[name][label_key(labels)] = value
+
+
+def register_gauge_function(name, function, **labels):
+    with lock:
+        gauge_functions[name].append((label_key(labels), function))
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def render():
+    lines = []
+    with lock:
+        snapshot = {name: dict(entries) for name, entries in values.items()}
+        functions = {name: list(entries) for name, entries in gauge_functions.items()}
+    for name, (kind, help_text, buckets) in definitions.items():
+        for labels, function in functions[name]:
+            snapshot[name][labels] = function()
+        if not snapshot[name]:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(snapshot[name].items()):
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write(render())
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood stderr
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    # serves /metrics from a daemon thread for as long as the process runs
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="sentify-metrics").start()
+    return server
@@ -1,14 +1,80 @@
-from models.formality.sentence_level_formality import get_sentence_formality, get_nomatch_formality
-from models.intent.intent_model import get_intent
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from models import inference, onnx_backend, quantization, registry, timing
+from models.formality import predict_formality
+from models.intent import intent_model
+from models.audience import audience_model
+from models.formality.sentence_level_formality import get_sentence_formality, get_sentence_formality_batch, get_nomatch_formality
+from models.intent.intent_model import get_intent, get_intent_batch
 from models.sentiment.sentiment_model import get_sentiment
-from models.audience.audience_model import get_audience
-
-def analyze(text):
-    # get sentiment, intent, formality, and audience
-    sentiment, sentiment_category = analyze_sentiment(text)
-    intent, i_confidence = analyze_intent(text)
-    formality = analyze_formality(text)
-    audience, a_confidence = analyze_audience(text)
+from models.sentiment.bulk_sentiment import get_sentiment_batch
+from models.audience.audience_model import get_audience, get_audience_batch
+
+# run the four analyzers in parallel threads (SENTIFY_CONCURRENT=1)
+CONCURRENT = os.environ.get("SENTIFY_CONCURRENT", "0") == "1"
+executor = None
+executor_lock = threading.Lock()
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            # torch.set_num_threads is process-wide and permanent, so capping the intra-op
+            # threads for the three concurrent analyzers is opt-in (e.g. cores // 3): it also
+            # slows every later forward pass in the process, batched or not
+            threads = os.environ.get("SENTIFY_TORCH_THREADS")
+            if threads:
+                torch.set_num_threads(int(threads))
+            executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sentify-analyze")
+    return executor
+
+def analyze(text, concurrent=None):
+    if concurrent is None:
+        concurrent = CONCURRENT
+    with timing.span("analyze"):
+        if concurrent:
+            return analyze_concurrent(text)
+        # get sentiment, intent, formality, and audience
+        sentiment, sentiment_category = analyze_sentiment(text)
+        intent, i_confidence = analyze_intent(text)
+        formality = analyze_formality(text)
+        audience, a_confidence = analyze_audience(text)
+        return make_result(sentiment, sentiment_category, intent, i_confidence, formality, audience, a_confidence)
+
+def analyze_concurrent(text):
+    # PyTorch releases the GIL during forward passes, so the analyzers overlap
+    pool = get_executor()
+    # each task runs in a copy of the caller's context so its timing spans are kept
+    sentiment = pool.submit(contextvars.copy_context().run, analyze_sentiment, text)
+    intent = pool.submit(contextvars.copy_context().run, analyze_intent, text)
+    formality = pool.submit(contextvars.copy_context().run, analyze_formality, text)
+    audience = pool.submit(contextvars.copy_context().run, analyze_audience, text)
+    return make_result(*sentiment.result(), *intent.result(), formality.result(), *audience.result())
+
+def analyze_batch(texts, batch_size=32):
+    # same as analyze, but each transformer runs once per batch of emails
+    texts = list(texts)
+    with timing.span("sentiment"):
+        sentiments = get_sentiment_batch(texts)
+    with timing.span("intent"):
+        intents = get_intent_batch(texts, batch_size)
+    with timing.span("formality"):
+        formalities = get_sentence_formality_batch(texts, batch_size)
+    with timing.span("audience"):
+        audiences = get_audience_batch(texts, batch_size)
+    results = []
+    for (sentiment, sentiment_category), (intent, i_confidence), formality, (audience, a_confidence) in zip(
+        sentiments, intents, formalities, audiences
+    ):
+        results.append(make_result(
+            sentiment, sentiment_category, intent, i_confidence, formality['classification'], audience, a_confidence
+        ))
+    return results
+
+def make_result(sentiment, sentiment_category, intent, i_confidence, formality, audience, a_confidence):
     result = {
         "sentiment_scores": sentiment,
         "sentiment_category": sentiment_category,
@@ -20,21 +86,63 @@ def analyze(text):
     }
     return result
 
+def directory_mtime(path):
+    # newest file in a local model directory, changes whenever it is retrained or re-exported
+    files = [os.path.join(path, name) for name in os.listdir(path)]
+    return max((os.path.getmtime(f) for f in files if os.path.isfile(f)), default=None)
+
+def model_revision(name, repo):
+    # the weights actually served: the ONNX export, a local directory or a hub commit
+    if onnx_backend.enabled():
+        path = onnx_backend.model_path(name)
+        return directory_mtime(path) if os.path.isdir(path) else None
+    if os.path.isdir(repo):
+        return directory_mtime(repo)
+    # the commit of the cached snapshot, read from disk so building the key never waits on the hub
+    with registry.import_lock:
+        from huggingface_hub import try_to_load_from_cache
+    path = try_to_load_from_cache(repo, "config.json")
+    if isinstance(path, str):
+        return os.path.basename(os.path.dirname(path))
+    return None
+
+def model_ids():
+    # identifies the models behind analyze(), used as part of the cache key
+    transformer_models = [("intent", intent_model), ("formality", predict_formality), ("audience", audience_model)]
+    return {
+        "backend": "default",
+        "runtime": onnx_backend.RUNTIME,
+        "long_text": f"window:{inference.WINDOW_TOKENS}/{inference.WINDOW_STRIDE}" if inference.WINDOWED else "truncate",
+        "quantized": [
+            name for name, module in transformer_models
+            if quantization.enabled(name, module.MODEL_REPO)
+        ],
+        "intent": intent_model.MODEL_REPO,
+        "formality": predict_formality.MODEL_REPO,
+        "audience": audience_model.MODEL_REPO,
+        "revisions": {name: model_revision(name, module.MODEL_REPO) for name, module in transformer_models},
+        "sentiment": "vader",
+    }
+
 def analyze_sentiment(text):
-    return get_sentiment(text)
+    with timing.span("sentiment"):
+        return get_sentiment(text)
 
 def analyze_intent(text):
-   return get_intent(text)    
+    with timing.span("intent"):
+        return get_intent(text)
 
 def analyze_formality(text):
-    formality = get_sentence_formality(text)['classification']
+    with timing.span("formality"):
+        formality = get_sentence_formality(text)['classification']
     return formality
 
 def get_sentence_formality_match(text, desired_formality):
     return get_nomatch_formality(text, desired_formality)
 
 def analyze_audience(text):
-    return get_audience(text)
+    with timing.span("audience"):
+        return get_audience(text)
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,67 @@
+import os
+
+import torch
+
+from models import registry
+from models.formality.formality_score import score_sentences
+from models.document import split_sentences
+from models.multitask.student import TASK_LABELS, MultiTaskStudent
+from models.sentiment.sentiment_model import get_sentiment
+
+MODEL_DIR = os.environ.get("SENTIFY_MULTITASK_MODEL", "out/multitask-student")
+
+
+def load_multitask_model():
+    with registry.import_lock:
+        from transformers import AutoTokenizer
+    student_tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
+    student_model = MultiTaskStudent.load(MODEL_DIR)
+    return student_tokenizer, student_model
+
+
+registry.register("multitask", load_multitask_model)
+
+
+def model_ids():
+    # identifies the student weights, used as part of the cache key
+    heads_path = os.path.join(MODEL_DIR, "heads.pt")
+    return {
+        "backend": "multitask",
+        "model_dir": os.path.abspath(MODEL_DIR),
+        "heads_mtime": os.path.getmtime(heads_path) if os.path.exists(heads_path) else None,
+        "sentiment": "vader",
+    }
+
+
+def predict(texts):
+    student_tokenizer, student_model = registry.get("multitask")
+    # single forward pass over all texts, returns per-task probabilities
+    inputs = student_tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
+    with torch.no_grad():
+        logits = student_model(inputs["input_ids"], inputs["attention_mask"])
+    return {task: torch.nn.functional.softmax(task_logits, dim=1) for task, task_logits in logits.items()}
+
+
+def analyze(text):
+    # drop-in replacement for models.models.analyze
+    # row 0 is the whole email (intent, audience), the rest are its sentences (formality)
+    sentences = split_sentences(text)
+    probs = predict([text] + sentences)
+
+    intent_conf, intent_pred = torch.max(probs["intent"][0], dim=0)
+    audience_conf, audience_pred = torch.max(probs["audience"][0], dim=0)
+    formality_labels = [
+        TASK_LABELS["formality"][pred] for pred in torch.argmax(probs["formality"][1:], dim=1).tolist()
+    ]
+    sentiment, sentiment_category = get_sentiment(text)
+
+    result = {
+        "sentiment_scores": sentiment,
+        "sentiment_category": sentiment_category,
+        "intent": TASK_LABELS["intent"][intent_pred.item()],
+        "intent_confidence": intent_conf.item(),
+        "formality": score_sentences(sentences, formality_labels)["classification"],
+        "audience": TASK_LABELS["audience"][audience_pred.item()],
+        "audience_confidence": audience_conf.item(),
+    }
+    return result
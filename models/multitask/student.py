@@ -0,0 +1,50 @@
+import json
+import os
+
+import torch
+
+from models import registry
+
+# label order of each head matches the teacher models
+TASK_LABELS = {
+    "intent": ["follow-up", "request", "inform"],
+    "audience": ["professional", "personal", "general"],
+    "formality": ["informal", "neutral", "formal"],
+}
+
+
+class MultiTaskStudent(torch.nn.Module):
+    # one shared encoder with a classification head per task
+    def __init__(self, encoder, task_labels=TASK_LABELS):
+        super().__init__()
+        self.encoder = encoder
+        self.task_labels = task_labels
+        hidden_size = encoder.config.hidden_size
+        self.dropout = torch.nn.Dropout(0.1)
+        self.heads = torch.nn.ModuleDict(
+            {task: torch.nn.Linear(hidden_size, len(labels)) for task, labels in task_labels.items()}
+        )
+
+    def forward(self, input_ids, attention_mask):
+        hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        pooled = self.dropout(hidden[:, 0])
+        return {task: head(pooled) for task, head in self.heads.items()}
+
+    def save(self, path, tokenizer):
+        os.makedirs(path, exist_ok=True)
+        self.encoder.save_pretrained(path)
+        tokenizer.save_pretrained(path)
+        torch.save(self.heads.state_dict(), os.path.join(path, "heads.pt"))
+        with open(os.path.join(path, "task_labels.json"), "w") as f:
+            json.dump(self.task_labels, f, indent=4)
+
+    @classmethod
+    def load(cls, path):
+        with registry.import_lock:
+            from transformers import AutoModel
+        with open(os.path.join(path, "task_labels.json")) as f:
+            task_labels = json.load(f)
+        student = cls(AutoModel.from_pretrained(path), task_labels)
+        student.heads.load_state_dict(torch.load(os.path.join(path, "heads.pt"), map_location="cpu"))
+        student.eval()
+        return student
@@ -0,0 +1,136 @@
+# Distills the intent, audience and formality teachers into one shared encoder
+# with three classification heads (see models/multitask/multitask_model.py).
+#
+# Example:
+#   python -m models.multitask.train_multitask --out out/multitask-student
+
+import argparse
+import csv
+import random
+
+import torch
+from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+from models.document import split_sentences
+from models.inference import predict_probs_batch
+from models.multitask.student import TASK_LABELS, MultiTaskStudent
+
+teacher_repos = {
+    "intent": "parvk11/intent_classification_model",
+    "audience": "parvk11/audience_classifier_model",
+    "formality": "rpangal/formality-roberta",
+}
+
+# bundled csv files and the column holding the email text
+corpus_files = [
+    ("models/intent/intent_classification_dataset.csv", "text"),
+    ("models/intent/large_synthetic_email_sentiment_dataset.csv", "email"),
+    ("models/sentiment/email_sentiment_full_dataset.csv", "email_text"),
+]
+
+
+def load_corpus(extra_text=None):
+    texts = []
+    for path, column in corpus_files:
+        with open(path, newline="", encoding="utf-8") as f:
+            texts.extend(row[column] for row in csv.DictReader(f))
+    if extra_text:
+        with open(extra_text, encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+    # the formality head scores single sentences, so train on those too
+    sentences = [sent for text in texts for sent in split_sentences(text)]
+    return list(dict.fromkeys(texts + sentences))
+
+
+def teacher_labels(texts, batch_size):
+    # soft labels from each teacher, columns in TASK_LABELS order
+    labels = {}
+    for task, repo in teacher_repos.items():
+        print(f"Labelling with {repo}...")
+        tokenizer = AutoTokenizer.from_pretrained(repo)
+        model = AutoModelForSequenceClassification.from_pretrained(repo)
+        model.eval()
+        probs = torch.stack(predict_probs_batch(tokenizer, model, texts, batch_size))
+        label2col = {label.lower(): i for i, label in model.config.id2label.items()}
+        if all(label in label2col for label in TASK_LABELS[task]):
+            probs = probs[:, [label2col[label] for label in TASK_LABELS[task]]]
+        labels[task] = probs
+        del model
+    return labels
+
+
+def distillation_loss(student_logits, teacher_probs, temperature):
+    # KL between tempered teacher and student distributions
+    teacher = torch.nn.functional.softmax(torch.log(teacher_probs.clamp_min(1e-8)) / temperature, dim=1)
+    student = torch.nn.functional.log_softmax(student_logits / temperature, dim=1)
+    return torch.nn.functional.kl_div(student, teacher, reduction="batchmean") * temperature ** 2
+
+
+def evaluate(student, tokenizer, texts, labels, batch_size):
+    student.eval()
+    agree = {task: 0 for task in TASK_LABELS}
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(texts[start:start + batch_size], return_tensors="pt", truncation=True, padding=True)
+            logits = student(inputs["input_ids"], inputs["attention_mask"])
+            for task in TASK_LABELS:
+                teacher_pred = labels[task][start:start + batch_size].argmax(dim=1)
+                agree[task] += (logits[task].argmax(dim=1) == teacher_pred).sum().item()
+    return {task: count / len(texts) for task, count in agree.items()}
+
+
+def train(args):
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    texts = load_corpus(args.extra_text)
+    labels = teacher_labels(texts, args.batch_size)
+
+    order = list(range(len(texts)))
+    random.shuffle(order)
+    split = int(len(order) * (1 - args.eval_fraction))
+    train_idx, eval_idx = order[:split], order[split:]
+
+    tokenizer = AutoTokenizer.from_pretrained(args.student)
+    student = MultiTaskStudent(AutoModel.from_pretrained(args.student))
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.learning_rate, weight_decay=0.01)
+
+    for epoch in range(args.epochs):
+        student.train()
+        random.shuffle(train_idx)
+        total_loss = 0.0
+        for start in range(0, len(train_idx), args.batch_size):
+            batch = train_idx[start:start + args.batch_size]
+            inputs = tokenizer([texts[i] for i in batch], return_tensors="pt", truncation=True, padding=True)
+            logits = student(inputs["input_ids"], inputs["attention_mask"])
+            loss = sum(
+                distillation_loss(logits[task], labels[task][batch], args.temperature) for task in TASK_LABELS
+            )
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        print(f"epoch {epoch + 1}: loss={total_loss / len(train_idx):.4f}")
+
+    eval_texts = [texts[i] for i in eval_idx]
+    eval_labels = {task: labels[task][eval_idx] for task in TASK_LABELS}
+    agreement = evaluate(student, tokenizer, eval_texts, eval_labels, args.batch_size)
+    for task, rate in agreement.items():
+        print(f"{task} agreement with teacher: {rate:.2%}")
+
+    student.save(args.out, tokenizer)
+    print(f"Saved student to {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill intent, audience and formality into one student model")
+    parser.add_argument("--student", default="distilroberta-base", help="Base encoder for the student")
+    parser.add_argument("--out", default="out/multitask-student", help="Output directory")
+    parser.add_argument("--extra-text", help="Optional file with additional unlabelled emails, one per line")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--eval-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    train(parser.parse_args())
@@ -0,0 +1,176 @@
+# Runs the intent, audience and formality classifiers with ONNX Runtime instead of
+# eager PyTorch (SENTIFY_RUNTIME=onnx). Export the models first:
+#
+#   python -m models.onnx_backend export --out out/onnx
+#   python -m models.onnx_backend check --out out/onnx
+#
+# onnxruntime (and onnx for exporting) are only needed when this runtime is used.
+
+import argparse
+import csv
+import os
+import sys
+from types import SimpleNamespace
+
+import torch
+
+from models import registry
+
+RUNTIME = os.environ.get("SENTIFY_RUNTIME", "torch")
+ONNX_DIR = os.environ.get("SENTIFY_ONNX_DIR", "out/onnx")
+INPUT_NAMES = ["input_ids", "attention_mask"]
+
+
+def enabled():
+    return RUNTIME == "onnx"
+
+
+def model_repos():
+    from models.audience import audience_model
+    from models.formality import predict_formality
+    from models.intent import intent_model
+    return {
+        "intent": intent_model.MODEL_REPO,
+        "audience": audience_model.MODEL_REPO,
+        "formality": predict_formality.MODEL_REPO,
+    }
+
+
+def model_path(name, onnx_dir=None):
+    return os.path.join(onnx_dir or ONNX_DIR, name)
+
+
+def session_options():
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    # constant folding, node fusions and fused attention for the transformer layers
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = int(os.environ.get("SENTIFY_ORT_THREADS", os.cpu_count() or 1))
+    options.inter_op_num_threads = 1
+    return options
+
+
+class OnnxSequenceClassifier:
+    # Stands in for an AutoModelForSequenceClassification in get_intent, get_audience
+    # and predict_probs_batch: called with the tokenizer's torch tensors, returns
+    # an object with .logits as a torch tensor.
+    device = torch.device("cpu")
+
+    def __init__(self, path):
+        with registry.import_lock:
+            import onnxruntime as ort
+            from transformers import AutoConfig
+        self.config = AutoConfig.from_pretrained(path)
+        self.session = ort.InferenceSession(
+            os.path.join(path, "model.onnx"), session_options(), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, **inputs):
+        feed = {name: inputs[name].cpu().numpy() for name in self.input_names}
+        (logits,) = self.session.run(["logits"], feed)
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def load(name, onnx_dir=None):
+    with registry.import_lock:
+        from transformers import AutoTokenizer
+    path = model_path(name, onnx_dir)
+    if not os.path.exists(os.path.join(path, "model.onnx")):
+        raise FileNotFoundError(
+            f"No ONNX export of the {name} model in {path}. Run `python -m models.onnx_backend export` first."
+        )
+    return AutoTokenizer.from_pretrained(path), OnnxSequenceClassifier(path)
+
+
+class LogitsOnly(torch.nn.Module):
+    # the exported graph returns a plain tensor instead of a ModelOutput
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export(name, repo, onnx_dir=None, opset=17):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    path = model_path(name, onnx_dir)
+    os.makedirs(path, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModelForSequenceClassification.from_pretrained(repo).eval()
+
+    sample = tokenizer(["An example email to trace the model.", "Hi"], return_tensors="pt", padding=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            os.path.join(path, "model.onnx"),
+            input_names=INPUT_NAMES,
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(path)
+    model.config.save_pretrained(path)
+    return path
+
+
+def load_check_texts(limit):
+    with open("models/intent/intent_classification_dataset.csv", newline="", encoding="utf-8") as f:
+        texts = [row["text"] for row in csv.DictReader(f)]
+    return texts[:limit]
+
+
+def check(name, repo, texts, onnx_dir=None, batch_size=32):
+    # compares the exported model with the PyTorch one on the same texts
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    from models.inference import predict_probs_batch
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModelForSequenceClassification.from_pretrained(repo).eval()
+    onnx_tokenizer, onnx_model = load(name, onnx_dir)
+
+    expected = predict_probs_batch(tokenizer, model, texts, batch_size)
+    actual = predict_probs_batch(onnx_tokenizer, onnx_model, texts, batch_size)
+    agreement = sum(int(e.argmax() == a.argmax()) for e, a in zip(expected, actual)) / len(texts)
+    max_diff = max(float((e - a).abs().max()) for e, a in zip(expected, actual))
+    return agreement, max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the classifiers to ONNX and check them against PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--out", default=ONNX_DIR, help="Directory for the exported models")
+    parser.add_argument("--models", nargs="+", choices=["intent", "audience", "formality"],
+                        default=["intent", "audience", "formality"])
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--limit", type=int, default=256, help="Texts to compare in check")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Largest allowed probability difference")
+    args = parser.parse_args()
+
+    repos = model_repos()
+    if args.command == "export":
+        for name in args.models:
+            print(f"Exporting {name} ({repos[name]})...", end="", flush=True)
+            print(f"Done: {export(name, repos[name], args.out, args.opset)}")
+        return
+
+    texts = load_check_texts(args.limit)
+    failed = False
+    for name in args.models:
+        agreement, max_diff = check(name, repos[name], texts, args.out)
+        ok = agreement == 1.0 and max_diff <= args.tolerance
+        failed = failed or not ok
+        print(f"{name}: label agreement {agreement:.2%}, max probability difference {max_diff:.2e} "
+              f"{'ok' if ok else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
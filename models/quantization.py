@@ -0,0 +1,160 @@
+# Optional dynamic INT8 quantization of the intent, audience and formality classifiers
+# (SENTIFY_QUANTIZE=1). Each model is only quantized if the last evaluation report
+# shows its INT8 predictions agree with FP32 often enough:
+#
+#   python -m models.quantization evaluate
+#
+# The report is written to SENTIFY_QUANTIZE_REPORT (out/quantization_report.json).
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import torch
+
+QUANTIZE = os.environ.get("SENTIFY_QUANTIZE", "0") == "1"
+MIN_AGREEMENT = float(os.environ.get("SENTIFY_QUANTIZE_MIN_AGREEMENT", "0.98"))
+REPORT_PATH = os.environ.get("SENTIFY_QUANTIZE_REPORT", "out/quantization_report.json")
+
+refused = set()
+
+
+def quantize(model):
+    # only the Linear layers (attention projections, feed-forward, classifier head) hold INT8 weights
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_report(path=None):
+    try:
+        with open(path or REPORT_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def enabled(name, repo):
+    # true if SENTIFY_QUANTIZE is set and the report clears this model for INT8
+    if not QUANTIZE:
+        return False
+    entry = load_report().get(name)
+    if entry and entry.get("repo") == repo and entry.get("agreement", 0) >= MIN_AGREEMENT:
+        return True
+    if name not in refused:
+        refused.add(name)
+        reason = (
+            f"agreement {entry['agreement']:.2%} is below {MIN_AGREEMENT:.2%}"
+            if entry and entry.get("repo") == repo
+            else f"no evaluation for {repo} in {REPORT_PATH}, run `python -m models.quantization evaluate`"
+        )
+        print(f"Not quantizing the {name} model: {reason}", file=sys.stderr)
+    return False
+
+
+def tensor_bytes(value):
+    # quantized Linear layers keep their weights as a (weight, bias) tuple in the state dict
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_size_mb(model):
+    return sum(tensor_bytes(value) for value in model.state_dict().values()) / 2**20
+
+
+def read_column(path, column):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row[column] for row in csv.DictReader(f)]
+
+
+def evaluation_sets(limit=None):
+    # name -> (texts, gold labels or None); only the intent csv is labelled
+    from models.document import split_sentences
+    emails = read_column("models/intent/intent_classification_dataset.csv", "text")
+    labels = read_column("models/intent/intent_classification_dataset.csv", "label")
+    other_emails = (
+        read_column("models/intent/large_synthetic_email_sentiment_dataset.csv", "email")
+        + read_column("models/sentiment/email_sentiment_full_dataset.csv", "email_text")
+    )
+    sentences = list(dict.fromkeys(sent for text in other_emails for sent in split_sentences(text)))
+    return {
+        "intent": (emails[:limit], labels[:limit]),
+        "audience": ((emails + other_emails)[:limit], None),
+        "formality": (sentences[:limit], None),
+    }
+
+
+def predict_labels(tokenizer, model, texts, id2label, batch_size):
+    from models.inference import classify_batch
+    start = time.perf_counter()
+    labels = [id2label[pred].lower() for pred, _ in classify_batch(tokenizer, model, texts, batch_size)]
+    return labels, time.perf_counter() - start
+
+
+def evaluate(repo, id2label, texts, gold=None, batch_size=32):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModelForSequenceClassification.from_pretrained(repo).eval()
+    id2label = id2label or model.config.id2label
+    quantized = quantize(model)
+
+    fp32, fp32_seconds = predict_labels(tokenizer, model, texts, id2label, batch_size)
+    int8, int8_seconds = predict_labels(tokenizer, quantized, texts, id2label, batch_size)
+    report = {
+        "repo": repo,
+        "texts": len(texts),
+        "agreement": sum(a == b for a, b in zip(fp32, int8)) / len(texts),
+        "fp32_mb": round(model_size_mb(model), 1),
+        "int8_mb": round(model_size_mb(quantized), 1),
+        "fp32_seconds": round(fp32_seconds, 3),
+        "int8_seconds": round(int8_seconds, 3),
+    }
+    if gold:
+        report["fp32_accuracy"] = sum(a == g for a, g in zip(fp32, gold)) / len(texts)
+        report["int8_accuracy"] = sum(a == g for a, g in zip(int8, gold)) / len(texts)
+        report["accuracy_delta"] = report["int8_accuracy"] - report["fp32_accuracy"]
+    return report
+
+
+def main():
+    from models.audience import audience_model
+    from models.formality import predict_formality
+    from models.intent import intent_model
+
+    parser = argparse.ArgumentParser(description="Compare INT8 and FP32 predictions of the classifiers")
+    parser.add_argument("command", choices=["evaluate"])
+    parser.add_argument("--report", default=REPORT_PATH, help="Where to write the report read by SENTIFY_QUANTIZE")
+    parser.add_argument("--limit", type=int, default=None, help="Texts per model")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    models = {
+        "intent": (intent_model.MODEL_REPO, intent_model.reverse_label_map),
+        "audience": (audience_model.MODEL_REPO, audience_model.reverse_label_map),
+        "formality": (predict_formality.MODEL_REPO, None),
+    }
+    report = {}
+    for name, (texts, gold) in evaluation_sets(args.limit).items():
+        repo, id2label = models[name]
+        result = evaluate(repo, id2label, texts, gold, args.batch_size)
+        report[name] = result
+        line = (f"{name}: agreement {result['agreement']:.2%} on {result['texts']} texts, "
+                f"{result['fp32_mb']} -> {result['int8_mb']} MB, "
+                f"{result['fp32_seconds']}s -> {result['int8_seconds']}s")
+        if gold:
+            line += (f", accuracy {result['fp32_accuracy']:.2%} -> {result['int8_accuracy']:.2%} "
+                     f"({result['accuracy_delta']:+.2%})")
+        print(line + ("" if result["agreement"] >= MIN_AGREEMENT else " (below threshold, stays FP32)"))
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import sys
+import threading
+import time
+
+from models import metrics, timing
+
+# name -> function that loads the resource, called on first use
+loaders = {}
+loaded = {}
+locks = {}
+registry_lock = threading.Lock()
+# transformers resolves its lazy attributes on first import, which fails with ImportError
+# when several loader threads do it at once; loaders import libraries under this lock
+import_lock = threading.Lock()
+
+
+def register(name, loader):
+    with registry_lock:
+        loaders[name] = loader
+        locks.setdefault(name, threading.Lock())
+
+
+def get(name):
+    if name in loaded:
+        return loaded[name]
+    # the span includes waiting on another thread (e.g. prewarm) that is already loading it
+    with timing.span(f"load:{name}"), locks[name]:
+        # another thread may have finished loading while we waited
+        if name not in loaded:
+            start = time.perf_counter()
+            loaded[name] = loaders[name]()
+            metrics.set_gauge("sentify_model_load_seconds", time.perf_counter() - start, model=name)
+    return loaded[name]
+
+
+def prewarm(names=None, background=True):
+    # load models in parallel so they are ready by the time they are needed
+    names = list(loaders) if names is None else list(names)
+    threads = [threading.Thread(target=warm, args=(name,), daemon=True) for name in names]
+    for thread in threads:
+        thread.start()
+    if not background:
+        for thread in threads:
+            thread.join()
+    return threads
+
+
+def warm(name):
+    try:
+        get(name)
+    except Exception as e:
+        # leave it unloaded, the caller will see the error again on first real use
+        print(f"Could not prewarm {name}: {type(e).__name__}: {e}", file=sys.stderr)
@@ -0,0 +1,40 @@
+import string
+from models import registry
+from models.sentiment.sentiment_model import get_sentiment_category
+
+def load_lexicon_words():
+    # hash set of every lexicon entry, used to skip texts VADER would score as neutral
+    sia = registry.get("vader")
+    return frozenset(sia.lexicon)
+
+registry.register("vader_lexicon_words", load_lexicon_words)
+
+def has_lexicon_word(tokens, lexicon_words):
+    for token in tokens:
+        token = token.lower()
+        if token in lexicon_words or token.strip(string.punctuation) in lexicon_words:
+            return True
+    return False
+
+def get_sentiment_batch(texts):
+    # same output as get_sentiment for each text, without re-running VADER's rules
+    # on duplicate texts or on texts with no sentiment-laden words
+    sia = registry.get("vader")
+    lexicon_words = registry.get("vader_lexicon_words")
+    scores = {}
+    for text in texts:
+        if text in scores:
+            continue
+        # VADER drops single character tokens before scoring
+        tokens = [token for token in str(text).split() if len(token) > 1]
+        if tokens and not has_lexicon_word(tokens, lexicon_words):
+            # every token scores 0, so VADER returns a fully neutral result
+            scores[text] = {"neg": 0.0, "neu": 1.0, "pos": 0.0, "compound": 0.0}
+        else:
+            scores[text] = sia.polarity_scores(text)
+
+    results = []
+    for text in texts:
+        sentiment = dict(scores[text])
+        results.append((sentiment, get_sentiment_category(sentiment)))
+    return results
\ No newline at end of file
@@ -1,12 +1,23 @@
 import nltk
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from models import registry
 
-# Download VADER lexicon if not already downloaded
-nltk.download('vader_lexicon')
+# Download VADER lexicon on first use if not already downloaded
+registry.register("vader_lexicon", lambda: nltk.download('vader_lexicon'))
+
+def load_analyzer():
+    registry.get("vader_lexicon")
+    # parsing the lexicon is the expensive part, so share one analyzer
+    return SentimentIntensityAnalyzer()
+
+registry.register("vader", load_analyzer)
 
 def get_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
+    sia = registry.get("vader")
     sentiment = sia.polarity_scores(text)
+    return sentiment, get_sentiment_category(sentiment)
+
+def get_sentiment_category(sentiment):
     # determine overall sentiment
     if sentiment["compound"] >= 0.05:
         sentiment_category = "positive"
@@ -14,4 +25,4 @@ def get_sentiment(text):
         sentiment_category = "negative"
     else:
         sentiment_category = "neutral"
-    return sentiment, sentiment_category
\ No newline at end of file
+    return sentiment_category
\ No newline at end of file
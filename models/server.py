@@ -0,0 +1,184 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import batching, metrics, registry
+from models.batching import QueueFull
+
+DEFAULT_PORT = 8531
+
+
+def load_backend():
+    # request threads share one set of models, and fast tokenizers can't be used from
+    # several threads at once. The default models each run on their micro-batcher's
+    # worker thread, which also merges concurrent requests into one forward pass; the
+    # multitask model runs one request at a time instead.
+    inference_lock = threading.Lock()
+
+    def locked(function):
+        def run(*args, **kwargs):
+            with inference_lock:
+                return function(*args, **kwargs)
+        return run
+
+    if os.environ.get("SENTIFY_BACKEND") == "multitask":
+        from models.multitask.multitask_model import analyze, model_ids
+        analyze = locked(analyze)
+        analyze_batch = lambda texts, batch_size=32: [analyze(text) for text in texts]
+    else:
+        batching.enable()
+        from models.models import analyze, analyze_batch, model_ids
+        locked = lambda function: function
+    from models.cache import cached_analyze
+
+    return cached_analyze(analyze, model_ids()), analyze_batch, locked
+
+
+def queue_depths():
+    from models.audience.audience_model import audience_batcher
+    from models.formality.predict_formality import formality_batcher
+    from models.intent.intent_model import intent_batcher
+    return {
+        "intent": intent_batcher.depth(),
+        "audience": audience_batcher.depth(),
+        "formality": formality_batcher.depth(),
+    }
+
+
+class SentifyHandler(BaseHTTPRequestHandler):
+    # JSON over HTTP; every endpoint takes a POST body and returns a JSON object
+    server_version = "Sentify/1.0"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "loaded": sorted(registry.loaded), "queued": queue_depths()})
+        elif self.path == "/metrics" and metrics.ENABLED:
+            data = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        handler = getattr(self, "handle_" + self.path.strip("/").replace("-", "_"), None)
+        if handler is None:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            self.send_json(200, handler(payload))
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+        except QueueFull as e:
+            self.send_json(503, {"error": f"Server busy: {e}"})
+        except Exception as e:
+            traceback.print_exc()
+            self.send_json(500, {"error": str(e)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # unix socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def handle_analyze(self, payload):
+        return self.server.analyze(payload["text"])
+
+    def handle_analyze_batch(self, payload):
+        return {"results": self.server.analyze_batch(payload["texts"], batch_size=payload.get("batch_size", 32))}
+
+    def handle_formality(self, payload):
+        from models.formality.sentence_level_formality import get_nomatch_formality, get_sentence_formality
+        if payload.get("desired_formality"):
+            return {"flagged": self.server.locked(get_nomatch_formality)(payload["text"], payload["desired_formality"])}
+        return self.server.locked(get_sentence_formality)(payload["text"])
+
+    def handle_formality_labels(self, payload):
+        from models.formality.predict_formality import getformality_batch
+        return {"labels": self.server.locked(getformality_batch)(payload["sentences"])}
+
+    def handle_feedback(self, payload):
+        from models.gpt import gpt_feedback
+        sentiment_data = payload.get("sentiment_data") or self.server.analyze(payload["text"])
+        return {"feedback": gpt_feedback(payload["text"], sentiment_data)}
+
+    def handle_generate(self, payload):
+        from models.gpt import gpt_generate_and_analyze
+        email, analysis = gpt_generate_and_analyze(
+            payload["text"],
+            self.server.analyze,
+            targets=payload.get("targets"),
+            feedback=payload.get("feedback"),
+        )
+        return {"email": email, "analysis": analysis}
+
+    def handle_edit(self, payload):
+        from models.gpt import gpt_edit_email
+        detected = payload.get("detected_sentiment_data") or self.server.analyze(payload["text"])
+        return gpt_edit_email(payload["text"], detected, payload.get("target_sentiment_data"))
+
+
+class SentifyHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default backlog of 5 refuses bursts of concurrent clients
+    request_queue_size = socket.SOMAXCONN
+
+
+class SentifyUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN
+
+
+def remove_stale_socket(socket_path):
+    # only ever delete a leftover socket, never a file passed to --socket by mistake
+    if not os.path.lexists(socket_path):
+        return
+    if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+    os.remove(socket_path)
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+    if socket_path:
+        remove_stale_socket(socket_path)
+    analyze, analyze_batch, locked = load_backend()
+    # load every model before accepting requests so the first client doesn't pay for it
+    print("Loading models...", end="", file=sys.stderr, flush=True)
+    registry.prewarm(background=False)
+    print("Done", file=sys.stderr)
+
+    if socket_path:
+        server = SentifyUnixServer(socket_path, SentifyHandler)
+        address = f"unix://{socket_path}"
+    else:
+        server = SentifyHTTPServer((host, port), SentifyHandler)
+        address = f"http://{host}:{port}"
+    server.analyze = analyze
+    server.analyze_batch = analyze_batch
+    server.locked = locked
+
+    print(f"Sentify server listening on {address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path:
+            remove_stale_socket(socket_path)
@@ -0,0 +1,88 @@
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+
+from models import metrics
+
+# Per-stage timings for one request. Nothing is recorded unless a caller has called
+# start() or metrics are on; otherwise span() is a shared no-op context manager.
+recorder = contextvars.ContextVar("sentify_timings", default=None)
+parent = contextvars.ContextVar("sentify_span", default="")
+no_span = nullcontext()
+
+
+class Timings:
+    # total seconds and call count per span; nested spans are named "outer/inner"
+    def __init__(self):
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            total, calls = self.spans.get(name, (0.0, 0))
+            self.spans[name] = (total + seconds, calls + 1)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                name: {"ms": round(total * 1000, 2), "calls": calls}
+                for name, (total, calls) in self.spans.items()
+            }
+
+
+def current():
+    return recorder.get()
+
+
+def start():
+    timings = Timings()
+    return timings, recorder.set(timings)
+
+
+def stop(token):
+    recorder.reset(token)
+
+
+def span(name):
+    if recorder.get() is None and not metrics.ENABLED:
+        return no_span
+    return Span(name)
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        outer = parent.get()
+        self.full_name = f"{outer}/{self.name}" if outer else self.name
+        self.token = parent.set(self.full_name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        timings = recorder.get()
+        if timings is not None:
+            timings.add(self.full_name, seconds)
+        metrics.observe("sentify_stage_seconds", seconds, stage=self.full_name)
+        parent.reset(self.token)
+
+
+def add(name, seconds):
+    # for work that can't sit inside a with block, e.g. a streamed reply
+    outer = parent.get()
+    full_name = f"{outer}/{name}" if outer else name
+    timings = recorder.get()
+    if timings is not None:
+        timings.add(full_name, seconds)
+    metrics.observe("sentify_stage_seconds", seconds, stage=full_name)
+
+
+def format_table(timings):
+    width = max([len(name) for name in timings] + [5])
+    lines = [f"{'stage':<{width}} {'ms':>10} {'calls':>6}"]
+    for name, entry in timings.items():
+        lines.append(f"{name:<{width}} {entry['ms']:>10.2f} {entry['calls']:>6}")
+    return "\n".join(lines)
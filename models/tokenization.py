@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+
+from models import metrics
+from models.cache import LRUCache
+
+# Tokenizers with the same vocabulary, merges, pre/post-processing and model inputs encode
+# a text identically, so each text is encoded once per vocabulary and the rows are reused
+# by every model that shares it (e.g. intent and audience on the same email).
+# SENTIFY_ENCODE_CACHE sets how many texts are kept, 0 turns the cache off.
+ENCODE_CACHE_SIZE = int(os.environ.get("SENTIFY_ENCODE_CACHE", "1024"))
+
+encodings = LRUCache(ENCODE_CACHE_SIZE)
+fingerprints = weakref.WeakKeyDictionary()
+# one lock per vocabulary, so a model waits for another that is encoding the same texts
+vocabulary_locks = {}
+lock = threading.Lock()
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compute_fingerprint(tokenizer):
+    if tokenizer.is_fast:
+        # tokenizer.json holds the vocab, merges, normalizer and special tokens
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        # truncation and padding are set per call and don't change the ids
+        state.pop("truncation", None)
+        state.pop("padding", None)
+        vocabulary = json.dumps(state, sort_keys=True)
+    else:
+        files = [
+            tokenizer.init_kwargs.get(name) for name in sorted(tokenizer.vocab_files_names)
+        ]
+        files = [path for path in files if isinstance(path, str) and os.path.isfile(path)]
+        if files:
+            vocabulary = json.dumps([file_digest(path) for path in files])
+        else:
+            vocabulary = json.dumps(sorted(tokenizer.get_vocab().items()))
+    data = json.dumps([type(tokenizer).__name__, list(tokenizer.model_input_names), vocabulary])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def fingerprint(tokenizer):
+    with lock:
+        value = fingerprints.get(tokenizer)
+    if value is None:
+        value = compute_fingerprint(tokenizer)
+        with lock:
+            fingerprints[tokenizer] = value
+    return value
+
+
+def vocabulary_lock(key):
+    with lock:
+        return vocabulary_locks.setdefault(key, threading.Lock())
+
+
+def cached_encode(tokenizer, texts, tokenize, settings=()):
+    # tokenize(texts) -> (encodings, owner text index per row), as inference.tokenize returns;
+    # only texts missing from the cache for this vocabulary and settings are passed to it
+    texts = list(texts)
+    if ENCODE_CACHE_SIZE <= 0:
+        return tokenize(texts)
+    key = (fingerprint(tokenizer), tuple(settings))
+    rows = {}
+    with vocabulary_lock(key):
+        for text in texts:
+            if text not in rows:
+                value = encodings.get(key + (text,))
+                if value is not None:
+                    rows[text] = json.loads(value)
+        missing = [text for text in dict.fromkeys(texts) if text not in rows]
+        metrics.inc("sentify_cache_requests_total", len(texts) - len(missing), cache="encode", result="hit")
+        metrics.inc("sentify_cache_requests_total", len(missing), cache="encode", result="miss")
+        if missing:
+            new, owners = tokenize(missing)
+            names = list(new.keys())
+            for text in missing:
+                rows[text] = []
+            for row, owner in enumerate(owners):
+                rows[missing[owner]].append({name: new[name][row] for name in names})
+            for text in missing:
+                encodings.set(key + (text,), json.dumps(rows[text]))
+
+    encoded = {}
+    owners = []
+    for i, text in enumerate(texts):
+        for row in rows[text]:
+            for name, value in row.items():
+                encoded.setdefault(name, []).append(value)
+            owners.append(i)
+    return encoded, owners
+
+
+def clear():
+    encodings.clear()
@@ -1,64 +1,143 @@
-import argparse, sys, json
+import argparse, sys, json, os, threading, asyncio, atexit
+from models import metrics, timing
 
 
 def load_resources():
-    from models.models import analyze
-    from models.gpt import gpt_feedback, gpt_generate_and_analyze
+    if os.environ.get("SENTIFY_BACKEND") == "multitask":
+        from models.multitask.multitask_model import analyze, model_ids
+    else:
+        from models.models import analyze, model_ids
+    from models.cache import cached_analyze
+    from models.gpt import analyze_with_ai_async, gpt_feedback_stream, gpt_generate_stream
 
     return (
-        analyze,
-        gpt_feedback,
-        gpt_generate_and_analyze,
+        cached_analyze(analyze, model_ids()),
+        analyze_with_ai_async,
+        gpt_feedback_stream,
+        gpt_generate_stream,
     )
 
+def load_batch_analyzer(client=None):
+    if client is not None:
+        return client.analyze_batch
+    if os.environ.get("SENTIFY_BACKEND") == "multitask":
+        from models.multitask.multitask_model import analyze
+        return lambda texts, batch_size: [analyze(text) for text in texts]
+    from models.models import analyze_batch
+    return analyze_batch
+
+def start_prewarm():
+    # load the models in the background while the input is being read
+    def warm():
+        try:
+            load_resources()
+            from models import registry
+            registry.prewarm(background=False)
+        except Exception:
+            # analyze_email will raise the error when it loads resources itself
+            pass
+    threading.Thread(target=warm, daemon=True).start()
+
 def print_verbose(text, verbose=False, **kwargs):
     if verbose:
         print(text, **kwargs)
 
-def analyze_email(email_text, verbose=False, json_output=False, ai_feedback=False, ai_generation=False):
+def print_results(results, title="Email Analysis Results"):
+    print(f"\n=== {title} ===")
+    print(f"Sentiment: {results['sentiment_category']} (compound score: {results['sentiment_scores']['compound']:.2f})")
+    print(f"Intent: {results['intent']} (confidence: {results['intent_confidence']})")
+    print(f"Formality: {results['formality']}")
+    print(f"Audience: {results['audience']} (confidence: {results['audience_confidence']})")
+
+def print_timings():
+    # only when --profile is recording
+    timings = timing.current()
+    if timings is not None:
+        print("\n=== Timings ===")
+        print(timing.format_table(timings.as_dict()))
+
+def print_stream(chunks):
+    # print tokens as they arrive and return the full text
+    text = ""
+    for chunk in chunks:
+        print(chunk, end="", flush=True)
+        text += chunk
+    print()
+    return text
+
+def analyze_email(email_text, verbose=False, json_output=False, ai_feedback=False, ai_generation=False, client=None):
+    if client is not None:
+        return analyze_email_remote(email_text, client, verbose, json_output, ai_feedback, ai_generation)
     print_verbose("Loading Resources...", verbose, end="")
     # Load all resources at once
     (
         analyze,
-        gpt_feedback,
-        gpt_generate,
+        analyze_with_ai,
+        gpt_feedback_stream,
+        gpt_generate_stream,
     ) = load_resources()
     print_verbose("Done", verbose)
 
-    print_verbose("Analyzing sentiment...", verbose, end="")
-    results = analyze(email_text)
+    if not json_output and (ai_feedback or ai_generation):
+        return stream_email_analysis(
+            email_text, analyze, gpt_feedback_stream, gpt_generate_stream, verbose, ai_feedback, ai_generation
+        )
+
+    feedback=None
+    gen_email=None
+    if ai_feedback or ai_generation:
+        # the azure calls overlap with the local analysis where they don't depend on it
+        print_verbose("Analyzing sentiment and generating AI output...", verbose, end="")
+        results, feedback, gen_email = asyncio.run(
+            analyze_with_ai(email_text, analyze, ai_feedback=ai_feedback, ai_generation=ai_generation)
+        )
+        print_verbose("Done", verbose)
+    else:
+        print_verbose("Analyzing sentiment...", verbose, end="")
+        results = analyze(email_text)
+        print_verbose("Done", verbose)
+
+    return print_analysis(results, feedback, gen_email, verbose, json_output, ai_feedback, ai_generation)
+
+def analyze_email_remote(email_text, client, verbose=False, json_output=False, ai_feedback=False, ai_generation=False):
+    # the models are already loaded in the server, so nothing is loaded here
+    print_verbose(f"Analyzing sentiment on {client.address}...", verbose, end="")
+    with timing.span("server:analyze"):
+        results = client.analyze(email_text)
     print_verbose("Done", verbose)
 
-    
     feedback=None
+    gen_email=None
+    if ai_feedback:
+        print_verbose("Generating AI feedback...", verbose, end="")
+        with timing.span("server:feedback"):
+            feedback = client.feedback(email_text, results)
+        print_verbose("Done", verbose)
+    if ai_generation:
+        print_verbose("Generating AI email...", verbose, end="")
+        with timing.span("server:generate"):
+            gen_email, _ = client.generate(email_text, feedback=bool(feedback))
+        print_verbose("Done", verbose)
+
+    return print_analysis(results, feedback, gen_email, verbose, json_output, ai_feedback, ai_generation)
+
+def print_analysis(results, feedback, gen_email, verbose=False, json_output=False, ai_feedback=False, ai_generation=False):
     # get ai feedback if wanted
     if ai_feedback:
-        print_verbose("Generating AI Feedback...", verbose, end="")
-        feedback = gpt_feedback(email_text, results)
         results['feedback'] = feedback
-        print_verbose("Done", verbose)
-    
     # generate ai email with feedback if given
     if ai_generation:
-        feedback_input=False
-        if feedback:
-            feedback_input=True
-        print_verbose("Generating AI Email...", verbose, end="")
-        gen_email, _ = gpt_generate(email_text, analyze, feedback=feedback_input)
         results['gen_email'] = gen_email
-        print_verbose("Done", verbose)
     
     if json_output:
+        if timing.current() is not None:
+            results['timings'] = timing.current().as_dict()
         print_verbose("Dumping Json...", verbose)
         print(json.dumps(results, indent=4))
         print_verbose("Done", verbose)
     else:
         # main results
-        print("\n=== Email Analysis Results ===")
-        print(f"Sentiment: {results['sentiment_category']} (compound score: {results['sentiment_scores']['compound']:.2f})")
-        print(f"Intent: {results['intent']} (confidence: {results['intent_confidence']})")
-        print(f"Formality: {results['formality']}")
-        print(f"Audience: {results['audience']} (confidence: {results['audience_confidence']})")
+        print_results(results)
 
         # print the ai feedback if feedback is enabled
         print_verbose("\n=== AI Feedback ===", ai_feedback)
@@ -67,10 +146,80 @@ def analyze_email(email_text, verbose=False, json_output=False, ai_feedback=Fals
         # print the ai generation if generation is enabled
         print_verbose("\n=== AI Email ===", ai_generation)
         print_verbose(gen_email, ai_generation)
+        print_timings()
 
     print_verbose("\nAnalysis complete!", verbose)
     return results
 
+def stream_email_analysis(email_text, analyze, gpt_feedback_stream, gpt_generate_stream, verbose=False, ai_feedback=False, ai_generation=False):
+    print_verbose("Analyzing sentiment...", verbose, end="")
+    results = analyze(email_text)
+    print_verbose("Done", verbose)
+    # show the classifier results before waiting on azure
+    print_results(results)
+
+    feedback=None
+    if ai_feedback:
+        print("\n=== AI Feedback ===")
+        feedback = print_stream(gpt_feedback_stream(email_text, results))
+        results['feedback'] = feedback
+
+    # generate ai email with feedback if given
+    if ai_generation:
+        print("\n=== AI Email ===")
+        gen_email = print_stream(gpt_generate_stream(email_text, feedback=bool(feedback))).strip()
+        results['gen_email'] = gen_email
+        print_verbose("Analyzing AI Email...", verbose, end="")
+        gen_results = analyze(gen_email)
+        print_verbose("Done", verbose)
+        print_results(gen_results, "AI Email Analysis Results")
+
+    print_timings()
+    print_verbose("\nAnalysis complete!", verbose)
+    return results
+
+def parse_jsonl_line(line, line_number):
+    # each line is either a json string or an object with a "text" (or "email") field
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, {"line": line_number, "error": f"Invalid JSON: {e}"}
+    if isinstance(record, str):
+        return record, {}
+    output = {}
+    if isinstance(record, dict):
+        # errors keep the input's id too, so consumers can match them up
+        output = {"id": record["id"]} if "id" in record else {}
+        text = record.get("text", record.get("email"))
+        if isinstance(text, str):
+            return text, output
+    output.update({"line": line_number, "error": "Expected a JSON string or an object with a \"text\" field"})
+    return None, output
+
+def write_jsonl_batch(batch, analyze_batch, batch_size, out_stream):
+    texts = [text for text, _ in batch if text is not None]
+    results = iter(analyze_batch(texts, batch_size=batch_size))
+    for text, output in batch:
+        if text is not None:
+            output.update(next(results))
+        out_stream.write(json.dumps(output) + "\n")
+    out_stream.flush()
+
+def analyze_jsonl_stream(batch_size=32, in_stream=sys.stdin, out_stream=sys.stdout, client=None):
+    # one email per input line, one result per output line, in input order;
+    # only one batch is held in memory at a time
+    analyze_batch = load_batch_analyzer(client)
+    batch = []
+    for line_number, line in enumerate(in_stream, 1):
+        if not line.strip():
+            continue
+        batch.append(parse_jsonl_line(line, line_number))
+        if len(batch) >= batch_size:
+            write_jsonl_batch(batch, analyze_batch, batch_size, out_stream)
+            batch = []
+    if batch:
+        write_jsonl_batch(batch, analyze_batch, batch_size, out_stream)
+
 def read_from_file(filename):
     try:
         with open(filename, 'r') as f:
@@ -80,15 +229,63 @@ def read_from_file(filename):
         sys.exit(1)
     return email_text
 
+def connect_server(address):
+    from models.client import SentifyClient
+    client = SentifyClient(address)
+    if not client.available():
+        print(f"Sentify server at {address} is not reachable, analyzing locally", file=sys.stderr)
+        return None
+    return client
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Sentify: Email Sentiment Analysis CLI")
+    parser.add_argument("command", nargs="?", choices=["serve"], help="Run a long-lived server that keeps the models loaded")
     parser.add_argument("--file", "-f", help="Path to file containing email text")
     parser.add_argument("--text", "-t", help="Email text to analyze in cli command")
     parser.add_argument("--verbose", "-v", action="store_true", help="Show detailed output")
     parser.add_argument("--json", "-j", action="store_true", help="Output results as JSON")
     parser.add_argument("--feedback", "-fb", action="store_true", help="Generate AI feedback")
     parser.add_argument("--gen", "-g", action="store_true", help="Generate AI email")
+    parser.add_argument("--no-cache", action="store_true", help="Skip the analysis and AI response caches")
+    parser.add_argument("--profile", "-p", action="store_true", help="Time each stage (a \"timings\" section in --json output)")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running")
+    parser.add_argument("--metrics-file", help="Write Prometheus metrics to this file on exit")
+    parser.add_argument("--stdin-jsonl", action="store_true", help="Read one email per line as JSON from stdin and write one JSON result per line")
+    parser.add_argument("--batch-size", type=int, default=32, help="Emails per batch in --stdin-jsonl mode")
+    parser.add_argument("--server", "-s", default=os.environ.get("SENTIFY_SERVER"), help="Send requests to a running server (http://host:port or unix:///path)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address for `serve` to listen on")
+    parser.add_argument("--port", type=int, default=8531, help="Port for `serve` to listen on")
+    parser.add_argument("--socket", help="Unix socket path for `serve` to listen on instead of a TCP port")
     args = parser.parse_args()
+    if args.no_cache:
+        os.environ["SENTIFY_CACHE"] = "0"
+        os.environ["SENTIFY_LLM_CACHE"] = "0"
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.metrics_file:
+        metrics.enable()
+        atexit.register(metrics.dump, args.metrics_file)
+
+    if args.command == "serve":
+        from models.server import serve
+        serve(host=args.host, port=args.port, socket_path=args.socket)
+        sys.exit(0)
+
+    if args.profile:
+        timing.start()
+    client = connect_server(args.server) if args.server else None
+    if client is None:
+        start_prewarm()
+
+    if args.stdin_jsonl:
+        try:
+            analyze_jsonl_stream(batch_size=args.batch_size, client=client)
+        except BrokenPipeError:
+            # downstream closed the pipe (e.g. `| head`), stop quietly
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        sys.exit(0)
 
     if args.file:
         email_text = read_from_file(args.file)
@@ -103,4 +300,4 @@ if __name__ == "__main__":
         Thanks,
         Person
         """
-    analyze_email(email_text, verbose=args.verbose, json_output=args.json, ai_feedback=args.feedback, ai_generation=args.gen)
\ No newline at end of file
+    analyze_email(email_text, verbose=args.verbose, json_output=args.json, ai_feedback=args.feedback, ai_generation=args.gen, client=client)
\ No newline at end of file